@@ -0,0 +1,326 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long the admin views take against a local backend filled
+with synthetic documents, and writes the timings as JSON so that they can
+be compared between releases.
+
+Run from the repository root::
+
+    python benchmarks/bench_views.py [--backend memory] [--documents 10000] [--repeat 5] [--output results.json]
+
+The documents are spread evenly over four models, each with the same
+faceted fields, and are indexed into either the in-memory backend from
+``memory_backend.py`` or a Whoosh index in a temporary directory. Haystack
+doesn't facet with Whoosh, so there the faceted case runs the same search
+as the first page.
+
+Every case is run once to warm up and then ``--repeat`` times, and reports
+the best, median and worst of those runs, in seconds. The view cases also
+report, for the median run, how long rendering the template took, and how
+many backend calls were made and how long they took between them, which
+may be more than the whole run when they were made concurrently.
+
+Requires Haystack 2.x and Django 1.8 or newer.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from random import Random
+from timeit import default_timer
+
+HERE = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import django
+
+
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf',
+         'hotel', 'india', 'juliett', 'kilo', 'lima', 'mike', 'november',
+         'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango', 'uniform',
+         'victor', 'whiskey', 'xray', 'yankee', 'zulu')
+CATEGORIES = tuple('category %d' % x for x in range(20))
+STATUSES = ('draft', 'review', 'published', 'archived')
+TAGS = tuple('tag%03d' % x for x in range(500))
+
+
+def configure(backend, path):
+    from django.conf import settings
+    if backend == 'whoosh':
+        connection = {'ENGINE': 'memory_backend.BenchmarkWhooshEngine',
+                      'PATH': os.path.join(path, 'whoosh')}
+    else:
+        connection = {'ENGINE': 'memory_backend.MemoryEngine'}
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmarks',
+        ALLOWED_HOSTS=['testserver'],
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(path, 'db.sqlite3'),
+            }
+        },
+        INSTALLED_APPS=[
+            'django.contrib.contenttypes',
+            'django.contrib.auth',
+            'django.contrib.sessions',
+            'django.contrib.admin',
+            'haystack',
+            'haystackbrowser',
+        ],
+        ROOT_URLCONF='tests_urls',
+        STATIC_URL='/__static__/',
+        TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'APP_DIRS': True,
+            'OPTIONS': {
+                'context_processors': [
+                    'django.template.context_processors.request',
+                    'django.contrib.auth.context_processors.auth',
+                ],
+            },
+        }],
+        HAYSTACK_CONNECTIONS={'default': connection},
+        # the objects only exist in the index.
+        HAYSTACKBROWSER_SIMILAR_LOOKUP='identifier',
+    )
+    django.setup()
+
+
+def make_objects(model, count, random):
+    for pk in range(1, count + 1):
+        obj = model(pk=pk)
+        words = [random.choice(WORDS) for x in range(30)]
+        obj.bench_text = ' '.join(words)
+        obj.bench_title = ' '.join(words[:4]).title()
+        obj.bench_category = random.choice(CATEGORIES)
+        obj.bench_status = random.choice(STATUSES)
+        obj.bench_tags = random.sample(TAGS, 3)
+        obj.bench_rank = random.randint(1, 100)
+        yield obj
+
+
+def make_facet_counts(random):
+    fields = {}
+    for field, values in (('category', CATEGORIES), ('status', STATUSES),
+                          ('tags', TAGS)):
+        counts = [(value, random.randint(1, 1000)) for value in values]
+        counts.sort(key=lambda count: count[1], reverse=True)
+        fields[field] = counts
+    return {'fields': fields, 'dates': {}, 'queries': {}}
+
+
+def fill_index(documents, seed, batch_size=1000):
+    from haystack import connections
+    from memory_backend import INDEXES
+    backend = connections['default'].get_backend()
+    backend.clear()
+    random = Random(seed)
+    per_model = documents // len(INDEXES)
+    for index_class in INDEXES:
+        index = index_class()
+        batch = []
+        for obj in make_objects(index.get_model(), per_model, random):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                backend.update(index, batch)
+                batch = []
+        if batch:
+            backend.update(index, batch)
+    return per_model * len(INDEXES)
+
+
+def summarise(timings):
+    ordered = sorted(timings)
+    return OrderedDict((
+        ('runs', len(ordered)),
+        ('best', ordered[0]),
+        ('median', ordered[len(ordered) // 2]),
+        ('worst', ordered[-1]),
+    ))
+
+
+def time_function(func, repeat):
+    func()
+    timings = []
+    for x in range(repeat):
+        started = default_timer()
+        func()
+        timings.append(default_timer() - started)
+    return summarise(timings)
+
+
+def time_view(view, repeat):
+    """
+    Runs the view and renders its response, recording the backend calls
+    made on the way, which is what
+    :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.record_backend_calls`
+    does when instrumentation is on.
+    """
+    from haystackbrowser.instrumentation import Recorder
+    view()
+    runs = []
+    for x in range(repeat):
+        with Recorder() as recorder:
+            started = default_timer()
+            response = view()
+            rendered = default_timer()
+            response.render()
+            finished = default_timer()
+        if response.status_code != 200:
+            raise AssertionError("%d response" % response.status_code)
+        runs.append((finished - started, finished - rendered, recorder))
+    runs.sort(key=lambda run: run[0])
+    summary = summarise([run[0] for run in runs])
+    seconds, render_seconds, recorder = runs[len(runs) // 2]
+    summary['backend'] = recorder.seconds
+    summary['render'] = render_seconds
+    summary['backend_calls'] = len(recorder.calls)
+    return summary
+
+
+def make_view(user, name, data=None, **kwargs):
+    from django.test import RequestFactory
+    try:
+        from django.urls import reverse, resolve
+    except ImportError:  # < Django 1.10
+        from django.core.urlresolvers import reverse, resolve
+    url = reverse('admin:haystackbrowser_haystackresults_%s' % name,
+                  kwargs=kwargs or None)
+    match = resolve(url)
+    factory = RequestFactory()
+
+    def view():
+        request = factory.get(url, data or {})
+        request.user = user
+        return match.func(request, *match.args, **match.kwargs)
+    return view
+
+
+def run(args):
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.http import QueryDict
+    from haystack.query import SearchQuerySet
+    from haystackbrowser.admin import HaystackResultsAdmin
+    from haystackbrowser.instrumentation import instrument_connections
+    from haystackbrowser.models import (FacetWrapper, HaystackResults,
+                                        SearchResultWrapper)
+    from haystackbrowser.pagination import run_query
+    from haystackbrowser.utils import ConnectionCapabilities, get_haystack_config
+
+    config = get_haystack_config()
+    if args.backend == 'memory':
+        # the in-memory backend facets, which its engine's name doesn't say.
+        config._memo['capabilities:default'] = ConnectionCapabilities(
+            alias='default', engine=config.get_engine(), faceting=True,
+            more_like_this=True, keyset_pagination=False, max_offset=None)
+    instrument_connections(['default'])
+
+    started = default_timer()
+    documents = fill_index(args.documents, args.seed)
+    index_seconds = default_timer() - started
+
+    user = User(pk=1, username='benchmarks', is_active=True, is_staff=True,
+                is_superuser=True)
+    per_page = HaystackResultsAdmin(HaystackResults, admin.site).get_results_per_page(None)
+    deep_page = max(int(documents * 0.9) // per_page, 0)
+    facet_fields = ['category', 'status', 'tags']
+    results = OrderedDict()
+    results['index.first_page'] = time_view(
+        make_view(user, 'changelist'), args.repeat)
+    results['index.deep_page'] = time_view(
+        make_view(user, 'changelist', {'p': deep_page}), args.repeat)
+    results['index.faceted'] = time_view(
+        make_view(user, 'changelist', {
+            'possible_facets': facet_fields,
+            'selected_facets': 'status:%s' % STATUSES[0],
+        }), args.repeat)
+    results['index.filtered'] = time_view(
+        make_view(user, 'changelist', {'q': WORDS[0], 'models': 'auth.user'}),
+        args.repeat)
+    results['view'] = time_view(
+        make_view(user, 'change', content_type='auth.user', pk=1), args.repeat)
+
+    # the same counts whichever backend is used, because Whoosh has none.
+    facet_counts = make_facet_counts(Random(args.seed))
+    querydict = QueryDict('', mutable=True)
+    querydict.setlist('possible_facets', sorted(facet_counts['fields']))
+    for name, limit in (('facets.group', 100), ('facets.group_unlimited', None)):
+        def group(limit=limit):
+            wrapped = FacetWrapper(facet_counts, querydict=querydict.copy(),
+                                   limit=limit)
+            for facet_group in wrapped.get_field_facets():
+                facet_group.grouper.link()
+        results[name] = time_function(group, args.repeat)
+
+    page = run_query(SearchQuerySet(), 0, per_page)[0]
+
+    def extract():
+        for result in page:
+            wrapper = SearchResultWrapper(result, 'admin')
+            wrapper.get_stored_field_count()
+            wrapper.get_stored_fields()
+            wrapper.get_additional_field_count()
+            wrapper.get_additional_fields()
+    results['wrapper.extract'] = time_function(extract, args.repeat)
+
+    from haystack import __version__ as haystack_version
+    if isinstance(haystack_version, (list, tuple)):
+        haystack_version = '.'.join(str(x) for x in haystack_version)
+    from haystackbrowser import __version__ as version
+    return OrderedDict((
+        ('benchmark', 'views'),
+        ('environment', OrderedDict((
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('haystack', haystack_version),
+            ('haystackbrowser', version),
+            ('backend', args.backend),
+            ('faceting', config.supports_faceting()),
+        ))),
+        ('documents', documents),
+        ('per_page', per_page),
+        ('deep_page', deep_page),
+        ('seed', args.seed),
+        ('index_seconds', index_seconds),
+        ('results', results),
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=('memory', 'whoosh'),
+                        default='memory')
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON to, instead of stdout')
+    args = parser.parse_args(argv)
+
+    path = tempfile.mkdtemp(prefix='haystackbrowser-bench-')
+    try:
+        configure(args.backend, path)
+        data = run(args)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    output = json.dumps(data, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
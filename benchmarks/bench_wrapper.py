@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how long SearchResultWrapper takes to extract the stored and
+additional fields of a document, the way ``view_data.html`` asks for them.
+
+Run from the repository root::
+
+    python benchmarks/bench_wrapper.py [--documents 100] [--fields 20] [--size 2000]
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import argparse
+import os
+import sys
+import timeit
+
+HERE = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests_settings")
+
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+
+from haystackbrowser.models import SearchResultWrapper
+
+
+class FakeField(object):
+    def __init__(self, model_attr):
+        self.model_attr = model_attr
+
+
+class FakeIndex(object):
+    def __init__(self, field_count):
+        self.fields = dict(('field_%d' % x, FakeField('attr_%d' % x))
+                           for x in range(field_count))
+
+    def get_content_field(self):
+        return 'field_0'
+
+
+class FakeResult(object):
+    """Just enough of a haystack SearchResult for the wrapper."""
+    app_label = 'benchmarks'
+    model_name = 'document'
+
+    def __init__(self, pk, index, stored, additional):
+        self.pk = pk
+        self.searchindex = index
+        self._stored = stored
+        self._additional = additional
+
+    def get_stored_fields(self):
+        return dict(self._stored)
+
+    def get_additional_fields(self):
+        return dict(self._additional)
+
+
+def make_documents(count, field_count, size):
+    index = FakeIndex(field_count)
+    text = ('<p>lorem <b>ipsum</b> dolor sit amet</p> ' * (size // 40 + 1))[:size]
+    stored = dict(('field_%d' % x, text) for x in range(field_count))
+    additional = dict(stored)
+    additional.update(('extra_%d' % x, text) for x in range(field_count // 2))
+    return [FakeResult(pk, index, stored, additional) for pk in range(count)]
+
+
+def render_like_template(wrapper):
+    wrapper.get_stored_field_count()
+    wrapper.get_stored_fields()
+    wrapper.get_additional_field_count()
+    wrapper.get_additional_fields()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--size', type=int, default=2000,
+                        help='characters per field value')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    documents = make_documents(args.documents, args.fields, args.size)
+
+    def run():
+        for document in documents:
+            render_like_template(SearchResultWrapper(document, 'admin'))
+
+    best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+    per_document = best / args.documents
+    print('%d documents, %d stored fields of %d characters' % (
+        args.documents, args.fields, args.size))
+    print('%.1f usec per document' % (per_document * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Search indexes and engines for the benchmarks, which run against either a
+Whoosh index on disk or the in-memory backend here.
+
+The in-memory backend keeps every document in a list and answers queries
+by scanning it, understanding just enough of what the admin asks for:
+content searches, field lookups, facet narrowing, model restrictions and
+field facets. It isn't meant to be quick, only predictable and free of
+dependencies, so that the time spent in haystackbrowser itself can be
+told apart using :py:mod:`haystackbrowser.instrumentation`.
+
+Requires Haystack 2.x.
+"""
+from __future__ import absolute_import
+import re
+from collections import Counter
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
+from haystack import indexes
+from haystack.backends import (BaseEngine, BaseSearchBackend,
+                               BaseSearchQuery, SearchNode)
+from haystack.backends.whoosh_backend import WhooshEngine
+from haystack.constants import DJANGO_CT, DJANGO_ID, ID
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+from haystack.utils.loading import UnifiedIndex
+
+
+NARROW_RE = re.compile(r'^(?P<field>[^:]+):"?(?P<value>.*?)"?$')
+
+#: every document indexed by the in-memory backend, for each connection,
+#: because each thread has its own backend instance.
+STORES = {}
+
+
+class DocumentIndex(indexes.SearchIndex):
+    """
+    The same fields for every model, taken from attributes which
+    ``benchmarks/bench_views.py`` sets on unsaved instances, so nothing
+    needs to be in the database.
+    """
+    text = indexes.CharField(document=True, model_attr='bench_text')
+    title = indexes.CharField(model_attr='bench_title')
+    category = indexes.CharField(model_attr='bench_category', faceted=True)
+    status = indexes.CharField(model_attr='bench_status', faceted=True)
+    tags = indexes.MultiValueField(model_attr='bench_tags', faceted=True)
+    rank = indexes.IntegerField(model_attr='bench_rank', faceted=True)
+
+
+class UserIndex(DocumentIndex, indexes.Indexable):
+    def get_model(self):
+        return User
+
+
+class GroupIndex(DocumentIndex, indexes.Indexable):
+    def get_model(self):
+        return Group
+
+
+class PermissionIndex(DocumentIndex, indexes.Indexable):
+    def get_model(self):
+        return Permission
+
+
+class ContentTypeIndex(DocumentIndex, indexes.Indexable):
+    def get_model(self):
+        return ContentType
+
+
+INDEXES = (UserIndex, GroupIndex, PermissionIndex, ContentTypeIndex)
+
+
+class BenchmarkUnifiedIndex(UnifiedIndex):
+    """
+    Always uses the indexes above, which discovery wouldn't find, because
+    the benchmarks aren't an installed app.
+    """
+    def collect_indexes(self):
+        return [index() for index in INDEXES]
+
+
+def _matches_value(field_value, filter_type, value):
+    if isinstance(field_value, (list, tuple)):
+        return any(_matches_value(x, filter_type, value)
+                   for x in field_value)
+    if filter_type == 'in':
+        return any(_matches_value(field_value, 'exact', x) for x in value)
+    if filter_type == 'range':
+        return value[0] <= field_value <= value[1]
+    if filter_type in ('gt', 'gte', 'lt', 'lte'):
+        if filter_type == 'gt':
+            return field_value > value
+        elif filter_type == 'gte':
+            return field_value >= value
+        elif filter_type == 'lt':
+            return field_value < value
+        return field_value <= value
+    field_value = force_text(field_value)
+    value = force_text(value)
+    if filter_type == 'startswith':
+        return field_value.startswith(value)
+    elif filter_type == 'endswith':
+        return field_value.endswith(value)
+    elif filter_type in ('content', 'contains', 'fuzzy'):
+        return value.lower() in field_value.lower().split()
+    return field_value == value
+
+
+def _matches_content(words, value):
+    terms = getattr(value, 'query_string', value)
+    for term in force_text(terms).lower().split():
+        if term.startswith('-'):
+            if term[1:] in words:
+                return False
+        elif term.strip('"') not in words:
+            return False
+    return True
+
+
+class MemorySearchBackend(BaseSearchBackend):
+    def __init__(self, connection_alias, **connection_options):
+        super(MemorySearchBackend, self).__init__(connection_alias,
+                                                  **connection_options)
+        self.store = STORES.setdefault(connection_alias, {
+            'documents': [], 'words': [], 'positions': {},
+        })
+
+    def update(self, index, iterable, commit=True):
+        documents = self.store['documents']
+        words = self.store['words']
+        positions = self.store['positions']
+        for obj in iterable:
+            document = index.full_prepare(obj)
+            text = document.get(index.get_content_field(), '')
+            if document[ID] in positions:
+                position = positions[document[ID]]
+                documents[position] = document
+                words[position] = frozenset(text.lower().split())
+            else:
+                positions[document[ID]] = len(documents)
+                documents.append(document)
+                words.append(frozenset(text.lower().split()))
+
+    def remove(self, obj_or_string, commit=True):
+        positions = self.store['positions']
+        position = positions.pop(get_identifier(obj_or_string), None)
+        if position is None:
+            return
+        del self.store['documents'][position]
+        del self.store['words'][position]
+        for identifier, later in positions.items():
+            if later > position:
+                positions[identifier] = later - 1
+
+    def clear(self, models=None, commit=True):
+        self.store['documents'][:] = []
+        self.store['words'][:] = []
+        self.store['positions'].clear()
+
+    def _matches(self, node, document, words):
+        matched = []
+        for child in node.children:
+            if isinstance(child, SearchNode):
+                matched.append(self._matches(child, document, words))
+                continue
+            expression, value = child
+            field, filter_type = node.split_expression(expression)
+            if field == 'content':
+                matched.append(_matches_content(words, value))
+            else:
+                value = getattr(value, 'query_string', value)
+                matched.append(field in document and _matches_value(
+                    document[field], filter_type, value))
+        if node.connector == SearchNode.OR:
+            result = any(matched)
+        else:
+            result = all(matched)
+        if node.negated:
+            return not result
+        return result
+
+    def _get_identifier(self, query):
+        """
+        :return: the document identifier, if the query asks for nothing
+                 but a single document by its model and primary key.
+        """
+        if query.connector != SearchNode.AND or query.negated:
+            return None
+        values = {}
+        for child in query.children:
+            if isinstance(child, SearchNode):
+                return None
+            field, filter_type = query.split_expression(child[0])
+            if field not in (DJANGO_CT, DJANGO_ID) or filter_type not in ('content', 'exact'):
+                return None
+            values[field] = force_text(getattr(child[1], 'query_string', child[1]))
+        if len(values) != 2:
+            return None
+        return '%s.%s' % (values[DJANGO_CT], values[DJANGO_ID])
+
+    def _find(self, query, models=None, narrow_queries=None):
+        content_types = None
+        if models:
+            content_types = set(get_model_ct(model) for model in models)
+        narrowed = []
+        for narrow_query in narrow_queries or ():
+            match = NARROW_RE.match(narrow_query)
+            if match is not None:
+                narrowed.append((match.group('field'), match.group('value')))
+        identifier = self._get_identifier(query)
+        if identifier is not None:
+            position = self.store['positions'].get(identifier)
+            if position is None:
+                return
+            candidates = [(self.store['documents'][position],
+                           self.store['words'][position])]
+        else:
+            candidates = zip(self.store['documents'], self.store['words'])
+        match_all = not query.children
+        for document, words in candidates:
+            if content_types is not None and document[DJANGO_CT] not in content_types:
+                continue
+            if not all(field in document and _matches_value(
+                    document[field], 'exact', value) for field, value in narrowed):
+                continue
+            if match_all or self._matches(query, document, words):
+                yield document
+
+    def _make_result(self, document, result_class=None):
+        app_label, model_name = document[DJANGO_CT].split('.')
+        stored = dict((key, value) for key, value in document.items()
+                      if key not in (ID, DJANGO_CT, DJANGO_ID))
+        return (result_class or SearchResult)(
+            app_label, model_name, document[DJANGO_ID], 1.0, **stored)
+
+    def search(self, query_string, sort_by=None, start_offset=0,
+               end_offset=None, facets=None, narrow_queries=None,
+               models=None, result_class=None, **kwargs):
+        found = list(self._find(query_string, models=models,
+                                narrow_queries=narrow_queries))
+        for field in reversed(sort_by or ()):
+            reverse = field.startswith('-')
+            field = field.lstrip('-')
+            found.sort(key=lambda document: document.get(field),
+                       reverse=reverse)
+        facet_counts = {}
+        if facets:
+            fields = {}
+            for field in facets:
+                counts = Counter()
+                for document in found:
+                    value = document.get(field)
+                    if isinstance(value, (list, tuple)):
+                        counts.update(value)
+                    elif value is not None:
+                        counts[value] += 1
+                fields[field] = counts.most_common()
+            facet_counts = {'fields': fields, 'dates': {}, 'queries': {}}
+        return {
+            'results': [self._make_result(document, result_class)
+                        for document in found[start_offset:end_offset]],
+            'hits': len(found),
+            'facets': facet_counts,
+        }
+
+    def more_like_this(self, model_instance, additional_query_string=None,
+                       start_offset=0, end_offset=None, models=None,
+                       limit_to_registered_models=None, result_class=None,
+                       **kwargs):
+        content_type = get_model_ct(model_instance)
+        pk = force_text(model_instance.pk)
+        found = [document for document in self.store['documents']
+                 if document[DJANGO_CT] == content_type and
+                 document[DJANGO_ID] != pk]
+        return {
+            'results': [self._make_result(document, result_class)
+                        for document in found[start_offset:end_offset]],
+            'hits': len(found),
+        }
+
+
+class MemorySearchQuery(BaseSearchQuery):
+    def build_query(self):
+        # the backend evaluates the filters itself.
+        return self.query_filter
+
+    def build_query_fragment(self, field, filter_type, value):
+        return '%s__%s=%r' % (field, filter_type, value)
+
+
+class MemoryEngine(BaseEngine):
+    backend = MemorySearchBackend
+    query = MemorySearchQuery
+    unified_index = BenchmarkUnifiedIndex
+
+
+class BenchmarkWhooshEngine(WhooshEngine):
+    unified_index = BenchmarkUnifiedIndex
@@ -1,14 +1,28 @@
+import json
 import logging
+from collections import OrderedDict
+from functools import partial
 from inspect import getargspec
+from itertools import chain
+from operator import itemgetter
 from django.core.exceptions import PermissionDenied
-from django.core.paginator import Paginator, InvalidPage
+from django.core.paginator import InvalidPage
+try:
+    from django.db import close_old_connections
+except ImportError:  # < Django 1.6
+    from django.db import close_connection as close_old_connections
 from haystack.exceptions import SearchBackendError
 try:
     from django.utils.encoding import force_text
 except ImportError:  # < Django 1.5
     from django.utils.encoding import force_unicode as force_text
+from django.template.defaultfilters import slugify
 from django.utils.translation import ugettext_lazy as _
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponse
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:  # < Django 1.5
+    from django.http import HttpResponse as StreamingHttpResponse
 try:
     from functools import update_wrapper
 except ImportError:  # < Django 1.6
@@ -26,10 +40,23 @@ from django.contrib.admin.options import ModelAdmin
 from django.conf import settings
 from haystack import __version__
 from haystack.query import SearchQuerySet
-from haystack.forms import model_choices
-from haystackbrowser.models import HaystackResults, SearchResultWrapper, FacetWrapper
+from haystackbrowser.models import (HaystackResults, SearchResultWrapper,
+                                    AppliedFacets, FacetWrapper, Facet)
 from haystackbrowser.forms import PreSelectedModelSearchForm
-from haystackbrowser.utils import get_haystack_settings
+from haystackbrowser.cache import (ResultCache, get_cache, get_results,
+                                   make_key, make_similar_key, set_results)
+from haystackbrowser.export import FORMATS as EXPORT_FORMATS
+from haystackbrowser.instrumentation import (Recorder, bind, get_recorder,
+                                             instrument_connections,
+                                             load_hook, phase)
+from haystackbrowser.pagination import (CursorPaginator, FanOutPaginator,
+                                        SearchPaginator, CURSOR_VAR,
+                                        fetch_documents, has_facets,
+                                        iter_results, run_query)
+from haystackbrowser.utils import (get_haystack_config, get_haystack_settings,
+                                   get_model_for_content_type,
+                                   get_object_or_none, get_thread_pool,
+                                   object_exists, split_document_id)
 from django.forms import Media
 try:
     from haystack.constants import DJANGO_CT, DJANGO_ID
@@ -67,8 +94,9 @@ class FakeChangeListForPaginator(object):
         self.page_num = page.number - 1
         self.can_show_all = False
         self.show_all = False
-        self.result_count = self.paginator.count
-        self.multi_page = self.result_count > per_page
+        self.result_count = getattr(self.paginator, 'display_count',
+                                    self.paginator.count)
+        self.multi_page = self.paginator.num_pages > 1
         self.request = request
         self.opts = model_opts
 
@@ -77,7 +105,7 @@ class FakeChangeListForPaginator(object):
         return get_query_string(self.request.GET, a_dict)
 
     def __repr__(self):
-        return '<%(module)s.%(cls)s page=%(page)d total=%(count)d>' % {
+        return '<%(module)s.%(cls)s page=%(page)d total=%(count)s>' % {
             'module': self.__class__.__module__,
             'cls': self.__class__.__name__,
             'page': self.page_num,
@@ -176,7 +204,9 @@ class HaystackResultsAdmin(object):
             # < 1.5
             from django.conf.urls.defaults import patterns, url
 
-        def wrap(view):
+        def wrap(view, instrumented=True):
+            if instrumented:
+                view = self.instrument_view(view)
             def wrapper(*args, **kwargs):
                 return self.admin_site.admin_view(view)(*args, **kwargs)
             return update_wrapper(wrapper, view)
@@ -187,6 +217,27 @@ class HaystackResultsAdmin(object):
             model_key = self.model._meta.module_name
 
         return patterns('',
+            url(regex=r'^export/(?P<export_format>%s)/$' % '|'.join(
+                    sorted(EXPORT_FORMATS)),
+                view=wrap(self.export, instrumented=False),
+                name='%s_%s_export' % (self.model._meta.app_label,
+                                       model_key)
+            ),
+            url(regex=r'^facets/(?P<field>[^/]+)/$',
+                view=wrap(self.facets),
+                name='%s_%s_facets' % (self.model._meta.app_label,
+                                       model_key)
+            ),
+            url(regex=r'^compare/$',
+                view=wrap(self.compare),
+                name='%s_%s_compare' % (self.model._meta.app_label,
+                                        model_key)
+            ),
+            url(regex=r'^(?P<content_type>[^/]+)/(?P<pk>.+)/similar/$',
+                view=wrap(self.similar),
+                name='%s_%s_similar' % (self.model._meta.app_label,
+                                        model_key)
+            ),
             url(regex=r'^(?P<content_type>.+)/(?P<pk>.+)/$',
                 view=wrap(self.view),
                 name='%s_%s_change' % (self.model._meta.app_label,
@@ -227,6 +278,248 @@ class HaystackResultsAdmin(object):
         """
         return PAGE_VAR
 
+    def get_cursor_var(self, request):
+        """Provides the name of the variable used in query strings to discover
+        where the next page of results starts, when using cursor pagination.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: the name of the variable used in query strings for cursors.
+        """
+        return CURSOR_VAR
+
+    def use_cursor_pagination(self, request):
+        """Allows for opting in to cursor based pagination, where each page
+        links only to the next via an opaque token, rather than to numbered
+        pages. Looks in Django's ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_CURSOR_PAGINATION``, falling back to **False**.
+
+        Deep offsets are expensive for most backends, because they have to
+        collect and discard everything before the requested page;
+        cursor pagination avoids that. Searches for keywords are still
+        paged by offset, because avoiding it means ordering the results by
+        their identifier, rather than by relevance.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: whether to paginate by cursor instead of page number.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_CURSOR_PAGINATION', False)
+
+    def get_approximate_count_threshold(self, request):
+        """Allows for displaying an approximate count (eg: **10,000+**) when
+        there are more results than this, and not offering pages beyond it.
+        Looks in Django's ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_APPROXIMATE_COUNT_AFTER``. If it's not found,
+        falls back to **None**, meaning counts are always exact.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: The number of results after which the count is approximate.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_APPROXIMATE_COUNT_AFTER',
+                       None)
+
+    def get_export_batch_size(self, request):
+        """Allows for overriding how many results are requested from the
+        backend at a time while exporting. Looks in Django's ``LazySettings``
+        object for the item ``HAYSTACKBROWSER_EXPORT_BATCH_SIZE``. If it's not
+        found, falls back to **500**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: The number of results to fetch in each request to the backend.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_EXPORT_BATCH_SIZE', 500)
+
+    def get_cache_timeout(self, request):
+        """Allows for overriding how long result pages are cached for, in
+        seconds, if ``HAYSTACKBROWSER_CACHE`` names a cache to use. Looks in
+        Django's ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_CACHE_TIMEOUT``, falling back to **300**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: The number of seconds to cache each page for.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_CACHE_TIMEOUT', 300)
+
+    def get_result_cache(self, request, form, searches):
+        """Provides somewhere to remember the backend's responses for the
+        search described by the form, if ``HAYSTACKBROWSER_CACHE`` names one
+        of the ``CACHES``. How many pages may be kept is bounded by that
+        cache's own ``MAX_ENTRIES`` option.
+
+        Nothing is cached for an invalid form, because its search may not
+        be the one the query string asked for.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param form: the bound search form.
+        :type form: :py:class:`~haystackbrowser.forms.PreSelectedModelSearchForm`
+        :param searches: the ``(alias, SearchQuerySet)`` pairs to be sent to
+                         the backends.
+        :type searches: list
+
+        :return: :py:class:`~haystackbrowser.cache.ResultCache` or `None`
+        """
+        cache = get_cache()
+        if cache is None or not form.is_valid():
+            return None
+        # the page is part of the key the paginator adds.
+        key = make_key(cache, searches)
+        return ResultCache(cache, key, timeout=self.get_cache_timeout(request))
+
+    def get_similar_objects_timeout(self, request):
+        """Allows for overriding how long the results similar to a document
+        are cached for, in seconds, if ``HAYSTACKBROWSER_CACHE`` names a cache
+        to use. Looks in Django's ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_SIMILAR_TIMEOUT``, falling back to **3600**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: The number of seconds to cache similar results for.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_SIMILAR_TIMEOUT', 3600)
+
+    def use_deferred_similar_objects(self, request):
+        """Allows for opting in to loading the similar results after the
+        stored data view has been shown, rather than before. Looks in
+        Django's ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_DEFER_SIMILAR``, falling back to **False**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: whether similar results are loaded separately.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_DEFER_SIMILAR', False)
+
+    def get_similar_objects_lookup(self, request):
+        """Allows for overriding how the stored data view decides whether
+        to look for similar results. Looks in Django's ``LazySettings``
+        object for the item ``HAYSTACKBROWSER_SIMILAR_LOOKUP``, which may be:
+
+        * ``object``, the default, to load the database row, as Haystack
+          would for ``SearchResult.object``;
+        * ``exists``, to only check that the row exists;
+        * ``identifier``, to not check at all, and ask the backend using
+          the document's identifier alone.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: one of the above.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_SIMILAR_LOOKUP', 'object')
+
+    def use_lazy_facets(self, request):
+        """Allows for opting in to loading facet counts separately, one field
+        at a time, when the field is opened in the sidebar, rather than
+        alongside the results. Looks in Django's ``LazySettings`` object for
+        the item ``HAYSTACKBROWSER_LAZY_FACETS``, falling back to **False**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: whether facet counts are loaded on demand.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_LAZY_FACETS', False)
+
+    def get_facet_limit(self, request):
+        """Allows for overriding how many values are shown for each facet,
+        the most frequent first. Looks in Django's ``LazySettings`` object for the
+        item ``HAYSTACKBROWSER_FACET_LIMIT``, falling back to **100**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: The most values to show, or `None` for all of them.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_FACET_LIMIT', 100)
+
+    def get_facet_mincount(self, request):
+        """Allows for overriding how many results a value must have to be
+        shown for a facet. Looks in Django's
+        ``LazySettings`` object for the item ``HAYSTACKBROWSER_FACET_MINCOUNT``,
+        falling back to **1**.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: The fewest results a value must have.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_FACET_MINCOUNT', 1)
+
+    def get_facet_options(self, request, form, using='default', prefix=None):
+        """Provides the options given to the backend when faceting, based on
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_facet_limit`
+        and :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_facet_mincount`.
+        One more value than the limit is asked for, to discover whether any
+        were left out.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param form: the bound search form.
+        :type form: :py:class:`~haystackbrowser.forms.PreSelectedModelSearchForm`
+        :param using: the connection being searched.
+        :type using: string
+        :param prefix: only count values starting with this.
+        :type prefix: string
+
+        :return: dictionary of keyword arguments for `SearchQuerySet.facet`
+        """
+        limit = self.get_facet_limit(request)
+        if limit is not None:
+            limit += 1
+        return form.haystack_config.get_facet_options(
+            limit=limit, mincount=self.get_facet_mincount(request),
+            prefix=prefix, using=using)
+
+    def get_instrumentation_hook(self, request):
+        """Allows for sending the backend calls recorded for each page
+        somewhere, such as a log or a metrics collector. Looks in Django's
+        ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_INSTRUMENTATION_HOOK``, which may be a callable or
+        the dotted path to one, falling back to **None**.
+
+        The hook is called with the request and the
+        :py:class:`~haystackbrowser.instrumentation.Recorder` once the page
+        has been rendered.
+        :py:func:`~haystackbrowser.instrumentation.log_backend_calls` is
+        provided as a starting point.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: a callable, or `None`.
+        """
+        return load_hook(getattr(settings, 'HAYSTACKBROWSER_INSTRUMENTATION_HOOK',
+                                 None))
+
+    def use_instrumentation(self, request):
+        """Allows for opting in to recording every call made to the search
+        backends while a page is built, which is then shown at the bottom of
+        the page and given to
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_instrumentation_hook`.
+        Looks in Django's ``LazySettings`` object for the item
+        ``HAYSTACKBROWSER_INSTRUMENT``, falling back to whether there's a hook.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: whether backend calls are recorded.
+        """
+        return getattr(settings, 'HAYSTACKBROWSER_INSTRUMENT',
+                       getattr(settings, 'HAYSTACKBROWSER_INSTRUMENTATION_HOOK',
+                               None) is not None)
+
     def get_search_var(self, request):
         """Provides the name of the variable used in query strings to discover
         what text search has been requested. Uses the same ``SEARCH_VAR`` as the standard
@@ -257,7 +550,8 @@ class HaystackResultsAdmin(object):
         :return: list of items wrapped with whatever :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_searchresult_wrapper` provides.
         """
         klass = self.get_searchresult_wrapper()
-        return tuple(klass(x, self.admin_site.name) for x in object_list)
+        with phase('wrap'):
+            return tuple(klass(x, self.admin_site.name) for x in object_list)
 
     def get_current_query_string(self, request, add=None, remove=None):
         """ Method to return a querystring with modified parameters.
@@ -273,6 +567,24 @@ class HaystackResultsAdmin(object):
         """
         return get_query_string(request.GET, new_params=add, remove=remove)
 
+    def get_facet_querydict(self, request, form):
+        """The search, as the facet links should continue it. Applying or
+        removing a facet changes the results, so the links start again from
+        the first page, rather than at a page or cursor of the old results.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param form: the bound search form.
+        :type form: :py:class:`~haystackbrowser.forms.PreSelectedModelSearchForm`
+
+        :return: a mutable copy of the form's cleaned data, as a QueryDict.
+        """
+        querydict = form.cleaned_data_querydict.copy()
+        for key in (self.get_paginator_var(request),
+                    self.get_cursor_var(request)):
+            querydict.pop(key, None)
+        return querydict
+
     def get_settings(self):
         """Find all Django settings prefixed with ``HAYSTACK_``
 
@@ -282,7 +594,60 @@ class HaystackResultsAdmin(object):
 
 
 
+    def instrument_view(self, view):
+        """Wraps one of the admin views so that, if
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.use_instrumentation`
+        says so, the backend calls it makes are recorded, using
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.record_backend_calls`.
+        """
+        def wrapper(request, *args, **kwargs):
+            if not self.use_instrumentation(request):
+                return view(request, *args, **kwargs)
+            return self.record_backend_calls(request, view, *args, **kwargs)
+        return update_wrapper(wrapper, view)
+
+    def record_backend_calls(self, request, view, *args, **kwargs):
+        """Runs the view with a
+        :py:class:`~haystackbrowser.instrumentation.Recorder` active, timing
+        the view and the rendering of its response separately, and then
+        gives the recorder to the hook from
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_instrumentation_hook`.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param view: the view to run.
+
+        :return: the rendered response.
+        """
+        instrument_connections(
+            [alias for alias, title in get_haystack_config().get_connections()])
+        recorder = Recorder(view=view.__name__)
+        with recorder:
+            with recorder.phase('view'):
+                response = view(request, *args, **kwargs)
+            # the template may make calls of its own, which should count.
+            if hasattr(response, 'render') and not response.is_rendered:
+                with recorder.phase('render'):
+                    response.render()
+        # a broken hook, including one which can't be imported, shouldn't
+        # break the page it's reporting on.
+        try:
+            hook = self.get_instrumentation_hook(request)
+        except Exception:
+            logger.warning("Instrumentation hook could not be loaded",
+                           exc_info=1, extra={'request': request})
+            return response
+        if hook is not None:
+            try:
+                hook(request, recorder)
+            except Exception:
+                logger.warning("Instrumentation hook %r failed", hook,
+                               exc_info=1, extra={'request': request})
+        return response
+
     def do_render(self, request, template_name, context):
+        # the footer can only show what happened before rendering started.
+        context.setdefault('backend_calls', get_recorder())
         if UPGRADED_RENDER:
             return TemplateResponse(request=request, template=template_name,
                                     context=context)
@@ -316,66 +681,115 @@ class HaystackResultsAdmin(object):
         form = PreSelectedModelSearchForm(request.GET or None, load_all=False)
         minimum_page = form.fields[page_var].min_value
         # Make sure there are some models indexed
-        available_models = model_choices()
+        available_models = form.fields['models'].choices
         if len(available_models) <= 0:
             raise Search404('No search indexes bound via Haystack')
 
-        # We've not selected any models, so we're going to redirect and select
-        # all of them. This will bite me in the ass if someone searches for a string
-        # but no models, but I don't know WTF they'd expect to return, anyway.
-        # Note that I'm only doing this to sidestep this issue:
-        # https://gist.github.com/3766607
-        if 'models' not in request.GET.keys():
-            # TODO: make this betterererer.
-            new_qs = ['&models=%s' % x[0] for x in available_models]
-            # if we're in haystack2, we probably want to provide the 'default'
-            # connection so that it behaves as if "initial" were in place.
-            if form.has_multiple_connections():
-                new_qs.append('&connection=' + form.fields['connection'].initial)
-            new_qs = ''.join(new_qs)
-            existing_query = request.GET.copy()
-            if page_var in existing_query:
-                existing_query.pop(page_var)
-            existing_query[page_var] = minimum_page
-            location = '%(path)s?%(existing_qs)s%(new_qs)s' % {
-                'existing_qs': existing_query.urlencode(),
-                'new_qs': new_qs,
-                'path': request.path_info,
-            }
-            return HttpResponseRedirect(location)
-
-        sqs = form.search()
+        lazy_facets = self.use_lazy_facets(request)
+        facet_limit = self.get_facet_limit(request)
+        facet_options = self.get_facet_options(
+            request, form, using=(form.get_selected_connections() or ['default'])[0])
+        sqs = form.search(include_facets=not lazy_facets,
+                          facet_options=facet_options)
         cleaned_GET = form.cleaned_data_querydict
-        try:
-            page_no = int(cleaned_GET.get(PAGE_VAR, minimum_page))
-        except ValueError:
-            page_no = minimum_page
         results_per_page = self.get_results_per_page(request)
-        paginator = Paginator(sqs, results_per_page)
-        try:
-            page = paginator.page(page_no+1)
-        except (InvalidPage, ValueError):
-            # paginator.page may raise InvalidPage if we've gone too far
-            # meanwhile, casting the querystring parameter may raise ValueError
-            # if it's None, or '', or other silly input.
-            raise Search404("Invalid page")
+        cursor_var = self.get_cursor_var(request)
+        fan_out = form.is_fan_out()
+        # merging several connections requires knowing everything up to
+        # the requested page, so there's nothing for a cursor to save.
+        use_cursor = self.use_cursor_pagination(request) and not fan_out
+        if use_cursor:
+            using = getattr(sqs.query, '_using', None) or 'default'
+            # a keyset orders by the identifier, which would throw away
+            # the relevance of each result to the query.
+            keyset = (form.haystack_config.supports_keyset_pagination(using=using)
+                      and not form.has_query())
+            paginator = CursorPaginator(
+                sqs, results_per_page, keyset=keyset,
+                max_offset=form.haystack_config.get_max_offset(using=using))
+            try:
+                page = paginator.page(cleaned_GET.get(cursor_var, None))
+            except InvalidPage:
+                raise Search404("Invalid cursor")
+            changelist = None
+            facet_counts = page.facet_counts
+            if facet_counts is None and has_facets(sqs):
+                # deeper keyset pages can't provide facets for the whole
+                # query, so have to ask again.
+                facet_counts = sqs.facet_counts()
+            first_page_query_string = self.get_current_query_string(
+                request, remove=[page_var, cursor_var])
+            next_page_query_string = None
+            if page.has_next():
+                next_page_query_string = self.get_current_query_string(
+                    request, add={cursor_var: page.next_cursor},
+                    remove=[page_var])
+            page_range = None
+            result_count = page.count
+            remaining_count = page.remaining
+        else:
+            try:
+                page_no = int(cleaned_GET.get(PAGE_VAR, minimum_page))
+            except ValueError:
+                page_no = minimum_page
+            approximate_after = self.get_approximate_count_threshold(request)
+            searches = form.search_connections(
+                sqs=sqs, include_facets=not lazy_facets,
+                facet_options=partial(self.get_facet_options, request, form))
+            result_cache = self.get_result_cache(request, form, searches)
+            if fan_out:
+                paginator = FanOutPaginator(
+                    searches, results_per_page,
+                    pool=get_thread_pool(), approximate_after=approximate_after,
+                    result_cache=result_cache)
+            else:
+                paginator = SearchPaginator(
+                    sqs, results_per_page, approximate_after=approximate_after,
+                    result_cache=result_cache)
+            try:
+                page = paginator.page(page_no+1)
+            except (InvalidPage, ValueError):
+                # paginator.page may raise InvalidPage if we've gone too far
+                # meanwhile, casting the querystring parameter may raise ValueError
+                # if it's None, or '', or other silly input.
+                raise Search404("Invalid page")
+            changelist = FakeChangeListForPaginator(request, page,
+                                                    results_per_page,
+                                                    self.model._meta)
+            # hits, count and facets all arrived in the same response.
+            facet_counts = paginator.facet_counts
+            first_page_query_string = None
+            next_page_query_string = None
+            # this may be expanded into xrange(*page_range) to copy what
+            # the paginator would yield. This prevents 50000+ pages making
+            # the page slow to render because of django-debug-toolbar.
+            page_range = (1, paginator.num_pages + 1)
+            result_count = paginator.display_count
+            remaining_count = None
 
         query = request.GET.get(self.get_search_var(request), None)
         connection = request.GET.get('connection', None)
         title = self.model._meta.verbose_name_plural
 
         wrapped_facets = FacetWrapper(
-            sqs.facet_counts(), querydict=form.cleaned_data_querydict.copy())
+            facet_counts or {}, querydict=self.get_facet_querydict(request, form),
+            limit=facet_limit)
+        lazy_facet_fields = ()
+        if lazy_facets:
+            lazy_facet_fields = tuple(Facet(x) for x in
+                                      sorted(cleaned_GET.getlist('possible_facets')))
 
         context = {
             'results': self.get_wrapped_search_results(page.object_list),
             'pagination_required': page.has_other_pages(),
-            # this may be expanded into xrange(*page_range) to copy what
-            # the paginator would yield. This prevents 50000+ pages making
-            # the page slow to render because of django-debug-toolbar.
-            'page_range': (1, paginator.num_pages + 1),
+            'page_range': page_range,
             'page_num': page.number,
-            'result_count': paginator.count,
+            'result_count': result_count,
+            'remaining_count': remaining_count,
+            'cursor_pagination': use_cursor,
+            'connection_timings': getattr(paginator, 'timings', ()),
+            'first_page_query_string': first_page_query_string,
+            'next_page_query_string': next_page_query_string,
             'opts': self.model._meta,
             'title': force_text(title),
             'root_path': getattr(self.admin_site, 'root_path', None),
@@ -384,14 +798,18 @@ class HaystackResultsAdmin(object):
             'form': form,
             'form_valid': form.is_valid(),
             'query_string': self.get_current_query_string(request, remove=[page_var]),
+            'export_query_string': self.get_current_query_string(
+                request, remove=[page_var, cursor_var]),
             'search_model_count': len(cleaned_GET.getlist('models')),
             'search_facet_count': len(cleaned_GET.getlist('possible_facets')),
             'search_var': self.get_search_var(request),
             'page_var': page_var,
             'facets': wrapped_facets,
-            'applied_facets': form.applied_facets(),
+            'lazy_facets': lazy_facet_fields,
+            'applied_facets': AppliedFacets(
+                querydict=self.get_facet_querydict(request, form)),
             'module_name': force_text(self.model._meta.verbose_name_plural),
-            'cl': FakeChangeListForPaginator(request, page, results_per_page, self.model._meta),
+            'cl': changelist,
             'haystack_version': _haystack_version,
             # Note: the empty Media object isn't specficially required for the
             # standard Django admin, but is apparently a pre-requisite for
@@ -405,6 +823,329 @@ class HaystackResultsAdmin(object):
                               template_name='admin/haystackbrowser/result_list.html',
                               context=context)
 
+    def export(self, request, export_format):
+        """The view for downloading every result matching the same query
+        as the :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.index`,
+        with their stored fields. Results are streamed as they arrive from the
+        backend, in batches of
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_export_batch_size`.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param export_format: either ``csv`` or ``jsonl``
+        :type export_format: string.
+
+        :return: A StreamingHttpResponse
+        """
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied("Not a superuser")
+
+        form = PreSelectedModelSearchForm(request.GET or None, load_all=False)
+        config = form.haystack_config
+        batch_size = self.get_export_batch_size(request)
+        fieldnames = set()
+        querysets = []
+        # when searching several connections, each is exported in turn;
+        # the facet counts would only be thrown away.
+        sqs = form.search(include_facets=False)
+        for using, sqs in form.search_connections(sqs=sqs):
+            fieldnames.update(config.get_stored_fields(models=sqs.query.models,
+                                                       using=using))
+            querysets.append(iter_results(
+                sqs, batch_size,
+                keyset=config.supports_keyset_pagination(using=using),
+                max_offset=config.get_max_offset(using=using)))
+        fieldnames = tuple(sorted(fieldnames))
+        results = chain.from_iterable(querysets)
+        generator, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(generator(results, fieldnames),
+                                         content_type=content_type)
+        filename = slugify(force_text(self.model._meta.verbose_name_plural))
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            filename, export_format)
+        return response
+
+    def get_more_like_this(self, request, model_instance, using=None):
+        """Finds up to **5** results which are similar to the given object,
+        if the backend supports it.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param model_instance: the object to find similar results for.
+        :param using: the connection to ask, if not the default.
+        :type using: string
+
+        :return: :py:class:`~haystack.models.SearchResult` objects.
+        """
+        if not get_haystack_config().supports_more_like_this(
+                using=using or 'default'):
+            return ()
+        sqs = SearchQuerySet()
+        if using is not None:
+            sqs = sqs.using(using)
+        # Refs #GH-15 - elasticsearch-py 2.x does not implement a .mlt
+        # method, but currently there's nothing in haystack-proper which
+        # prevents using the 2.x series with the haystack-es1 backend.
+        # At some point haystack will have a separate es backend ...
+        # and I have no idea if/how I'm going to support that.
+        try:
+            return tuple(sqs.more_like_this(model_instance)[:5])
+        except AttributeError as e:
+            logger.debug("Support for 'more like this' functionality was "
+                         "not found, possibly because you're using "
+                         "the elasticsearch-py 2.x series with haystack's "
+                         "ES1.x backend", exc_info=1, extra={'request': request})
+            return ()
+
+    def find_similar_objects(self, request, model, pk, using=None):
+        """Loads the database row for the given model and primary key, and
+        finds the results similar to it. Runs on a thread from
+        :py:func:`~haystackbrowser.utils.get_thread_pool`.
+
+        Depending on
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_similar_objects_lookup`,
+        the row may only be checked for, or not even that, in which case
+        the model instance is an unsaved one with only the primary key set,
+        which is all the backends need to find similar results.
+
+        :return: a tuple of the model instance (or `None` if the row no
+                 longer exists) and the similar results.
+        """
+        lookup = self.get_similar_objects_lookup(request)
+        try:
+            if lookup == 'identifier':
+                model_instance = model(pk=pk)
+            elif lookup == 'exists':
+                model_instance = None
+                if object_exists(model, pk):
+                    model_instance = model(pk=pk)
+            else:
+                model_instance = get_object_or_none(model, pk)
+            if model_instance is None:
+                return None, ()
+            return model_instance, self.get_more_like_this(
+                request, model_instance, using=using)
+        finally:
+            # database connections belong to the thread, and this one
+            # never sees the end of the request.
+            close_old_connections()
+
+    def get_similar_objects(self, request, content_type, model, pk,
+                            using=None):
+        """Finds the results similar to the given object, using
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.find_similar_objects`,
+        unless they were found recently enough to still be in the cache named
+        by ``HAYSTACKBROWSER_CACHE``.
+
+        :return: a tuple of the model instance, which is `None` if the row no
+                 longer exists or the results came from the cache, and the
+                 similar results.
+        """
+        cache = get_cache()
+        if cache is None:
+            return self.find_similar_objects(request, model, pk, using=using)
+        key = make_similar_key(cache, content_type, pk,
+                               using or 'default')
+        results = get_results(cache, key)
+        if results is not None:
+            return None, tuple(results)
+        model_instance, results = self.find_similar_objects(
+            request, model, pk, using=using)
+        if model_instance is not None:
+            set_results(cache, key, results,
+                        self.get_similar_objects_timeout(request))
+        return model_instance, results
+
+    def get_similar_objects_connection(self, form):
+        """
+        :return: the first connection chosen in the search form, or `None`
+                 for the default.
+        """
+        if not form.has_multiple_connections():
+            return None
+        connections = form.get_selected_connections()
+        if connections:
+            return connections[0]
+        return None
+
+    def similar(self, request, content_type, pk):
+        """The view for loading the results similar to a single item in the
+        Haystack index, for when
+        :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.use_deferred_similar_objects`
+        is on.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param content_type: ``app_label`` and ``model_name`` as stored in Haystack, separated by "."
+        :type content_type: string.
+        :param pk: the object identifier stored in Haystack
+        :type pk: string.
+
+        :return: An HttpResponse containing JSON.
+        """
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied("Not a superuser")
+
+        model = get_model_for_content_type(content_type)
+        if model is None:
+            raise Search404("{ct!r} is not a model".format(ct=content_type))
+        form = PreSelectedModelSearchForm(request.GET or None, load_all=False)
+        using = self.get_similar_objects_connection(form)
+        model_instance, raw_mlt = self.get_similar_objects(
+            request, content_type, model, pk, using=using)
+        values = []
+        for result in self.get_wrapped_search_results(raw_mlt):
+            values.append({
+                'verbose_name': force_text(result.verbose_name),
+                'content_type': force_text(result.content_type()),
+                'pk': force_text(result.pk),
+                'score': result.score,
+                'link': result.get_detail_url(),
+            })
+        data = {'content_type': content_type, 'pk': pk, 'values': values}
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    def facets(self, request, field):
+        """The view for loading the counts of a single facet field for the
+        same query as the :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.index`,
+        limited by :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_facet_limit`
+        and :py:meth:`~haystackbrowser.admin.HaystackResultsAdmin.get_facet_mincount`.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+        :param field: the facet field name.
+        :type field: string.
+
+        :return: An HttpResponse containing JSON.
+        """
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied("Not a superuser")
+
+        form = PreSelectedModelSearchForm(request.GET or None, load_all=False)
+        possible = dict(form.fields['possible_facets'].choices)
+        if field not in possible:
+            raise Search404("{field!r} is not a facet".format(field=field))
+        limit = self.get_facet_limit(request)
+        mincount = self.get_facet_mincount(request)
+        prefix = request.GET.get('prefix', '').strip()
+        sqs = form.search(include_facets=False)
+        using = getattr(sqs.query, '_using', None) or 'default'
+        options = self.get_facet_options(request, form, using=using,
+                                         prefix=prefix)
+        results, hits, facet_counts = run_query(sqs.facet(field, **options),
+                                                0, 1)
+        # not every backend understands the options.
+        counts = (facet_counts or {}).get('fields', {}).get(field, ())
+        counts = [x for x in counts
+                  if (mincount is None or x[1] >= mincount) and
+                  force_text(x[0]).startswith(prefix)]
+        counts.sort(key=itemgetter(1), reverse=True)
+
+        querydict = self.get_facet_querydict(request, form)
+        wrapped_facets = FacetWrapper({'fields': {field: counts}},
+                                      querydict=querydict, limit=limit)
+        values = []
+        truncated = False
+        for group in wrapped_facets.get_field_facets():
+            truncated = group.truncated
+            group_link = group.grouper.link()
+            for item in group.list:
+                link = group_link
+                if item.fieldvalue not in link:
+                    link = '%s&selected_facets=%s' % (link, item.fieldvalue)
+                values.append({'value': item.value, 'count': item.count,
+                               'link': link})
+        data = {'field': field, 'title': force_text(possible[field]),
+                'prefix': prefix, 'truncated': truncated, 'values': values}
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    def find_documents(self, content_type, pks):
+        """Fetches the documents for several objects of the same model with
+        a single query.
+
+        :param content_type: ``app_label`` and ``model_name`` as stored in Haystack, separated by "."
+        :type content_type: string.
+        :param pks: the object identifiers stored in Haystack
+        :type pks: list of strings.
+
+        :return: :py:class:`~haystack.models.SearchResult` objects, in
+                 whatever order the backend gave them.
+        """
+        return fetch_documents(SearchQuerySet(), content_type, pks)
+
+    def compare(self, request):
+        """The view for showing the stored fields of several items in the
+        Haystack index side by side. Each item is given as an ``ids``
+        parameter, in the ``app_label.model_name.pk`` format, and the items
+        of each model are fetched by one query.
+
+        :param request: the current request.
+        :type request: WSGIRequest
+
+        :return: A template rendered into an HttpReponse
+        """
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied("Not a superuser")
+
+        requested = []
+        pks_by_content_type = OrderedDict()
+        for document_id in request.GET.getlist('ids'):
+            parts = split_document_id(document_id)
+            if parts is None or parts in requested:
+                continue
+            requested.append(parts)
+            pks_by_content_type.setdefault(parts[0], []).append(parts[1])
+        if not requested:
+            raise Search404("No documents to compare")
+
+        lookups = list(pks_by_content_type.items())
+        try:
+            if len(lookups) > 1:
+                responses = get_thread_pool().map(
+                    bind(lambda lookup: self.find_documents(*lookup)), lookups)
+            else:
+                responses = [self.find_documents(*lookup) for lookup in lookups]
+        except SearchBackendError as e:
+            raise Search404("{exc!r} while comparing {ids!r}".format(
+                ids=requested, exc=e))
+
+        found = {}
+        for results in responses:
+            for result in self.get_wrapped_search_results(results):
+                key = ('%s.%s' % (result.object.app_label, result.model_name),
+                       force_text(result.pk))
+                found[key] = result
+        documents = [found[key] for key in requested if key in found]
+        missing = ['%s.%s' % key for key in requested if key not in found]
+
+        fieldnames = []
+        for document in documents:
+            for key in sorted(document.get_stored_fields()):
+                if key not in fieldnames:
+                    fieldnames.append(key)
+        rows = []
+        for key in fieldnames:
+            values = [document.get_stored_fields().get(key)
+                      for document in documents]
+            raw_values = set(value['raw'] if value else None
+                             for value in values)
+            rows.append((key, values, len(raw_values) > 1))
+
+        context = {
+            'title': _('Compare stored data'),
+            'app_label': self.model._meta.app_label,
+            'module_name': force_text(self.model._meta.verbose_name_plural),
+            'documents': documents,
+            'missing': missing,
+            'rows': rows,
+            'haystack_version': _haystack_version,
+        }
+        # Update the context with variables that should be available to every page
+        context.update(self.each_context_compat(request))
+        return self.do_render(request=request,
+                              template_name='admin/haystackbrowser/compare.html',
+                              context=context)
+
     def view(self, request, content_type, pk):
         """The view for showing the results of a single item in the Haystack index.
 
@@ -421,6 +1162,18 @@ class HaystackResultsAdmin(object):
             raise PermissionDenied("Not a superuser")
 
         query = {DJANGO_ID: pk, DJANGO_CT: content_type}
+        model = get_model_for_content_type(content_type)
+        form = PreSelectedModelSearchForm(request.GET or None, load_all=False)
+        form_valid = form.is_valid()
+        using = self.get_similar_objects_connection(form)
+        deferred = model is not None and self.use_deferred_similar_objects(request)
+        similar = None
+        if model is not None and not deferred:
+            # The row, and the documents like it, don't depend on the search
+            # result, so can be fetched while waiting for it.
+            similar = get_thread_pool().apply_async(
+                bind(self.get_similar_objects), (request, content_type, model, pk),
+                {'using': using})
         try:
             raw_sqs = SearchQuerySet().filter(**query)[:1]
             wrapped_sqs = self.get_wrapped_search_results(raw_sqs)
@@ -432,28 +1185,26 @@ class HaystackResultsAdmin(object):
             raise Search404("{exc!r} while trying query {q!r}".format(
                 q=query, exc=e))
 
-        more_like_this = ()
-        # the model may no longer be in the database, instead being only backed
-        # by the search backend.
-        model_instance = sqs.object.object
-        if model_instance is not None:
-            # Refs #GH-15 - elasticsearch-py 2.x does not implement a .mlt
-            # method, but currently there's nothing in haystack-proper which
-            # prevents using the 2.x series with the haystack-es1 backend.
-            # At some point haystack will have a separate es backend ...
-            # and I have no idea if/how I'm going to support that.
-            try:
-                raw_mlt = SearchQuerySet().more_like_this(model_instance)[:5]
-            except AttributeError as e:
-                logger.debug("Support for 'more like this' functionality was "
-                             "not found, possibly because you're using "
-                             "the elasticsearch-py 2.x series with haystack's "
-                             "ES1.x backend", exc_info=1, extra={'request': request})
-                raw_mlt = ()
-            more_like_this = self.get_wrapped_search_results(raw_mlt)
-
-        form = PreSelectedModelSearchForm(request.GET or None, load_all=False)
-        form_valid = form.is_valid()
+        raw_mlt = ()
+        if similar is not None:
+            model_instance, raw_mlt = similar.get()
+            if (model_instance is not None and
+                    self.get_similar_objects_lookup(request) == 'object'):
+                # saves loading the same row again.
+                sqs.object.object = model_instance
+        elif not deferred:
+            # the model may no longer be in the database, instead being only
+            # backed by the search backend.
+            model_instance = sqs.object.object
+            if model_instance is not None:
+                raw_mlt = self.get_more_like_this(request, model_instance,
+                                                  using=using)
+        more_like_this = self.get_wrapped_search_results(raw_mlt)
+
+        similar_objects_url = None
+        if deferred:
+            similar_objects_url = 'similar/%s' % self.get_current_query_string(
+                request)
 
         context = {
             'original': sqs,
@@ -463,6 +1214,7 @@ class HaystackResultsAdmin(object):
             'haystack_settings': self.get_settings(),
             'has_change_permission': self.has_change_permission(request, sqs),
             'similar_objects': more_like_this,
+            'similar_objects_url': similar_objects_url,
             'haystack_version': _haystack_version,
             'form': form,
             'form_valid': form_valid,
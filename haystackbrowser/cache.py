@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import time
+from django.conf import settings
+try:
+    from django.core.cache import caches
+
+    def _get_cache(alias):
+        return caches[alias]
+except ImportError:  # < Django 1.7
+    from django.core.cache import get_cache as _get_cache
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
+from haystackbrowser.utils import get_haystack_config
+
+
+logger = logging.getLogger(__name__)
+
+#: holds the number which is part of every page key, and is changed to
+#: invalidate all of them at once.
+GENERATION_KEY = 'haystackbrowser:generation'
+
+
+def get_cache():
+    """
+    Provides the Django cache named by ``HAYSTACKBROWSER_CACHE``, or `None`
+    if result pages shouldn't be cached, which is the default.
+    """
+    alias = getattr(settings, 'HAYSTACKBROWSER_CACHE', None)
+    if alias is None:
+        return None
+    return _get_cache(alias)
+
+
+def get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # starting from the time, rather than 1, means that a generation
+        # which was evicted can't come back and revive old pages.
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    """
+    Forgets every cached result page, by moving on to a new generation.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # there's no generation, so nothing can be found anyway.
+        pass
+
+
+#: the parts of a search query, other than the query string itself, which
+#: change what the backend responds with.
+QUERY_ATTRIBUTES = ('models', 'order_by', 'narrow_queries', 'facets',
+                    'date_facets', 'query_facets', 'boost', 'highlight',
+                    'spelling_query', 'result_class')
+
+
+def _normalise(value):
+    if isinstance(value, dict):
+        return sorted((force_text(key), _normalise(item))
+                      for key, item in value.items())
+    if isinstance(value, (set, frozenset)):
+        return sorted(_normalise(x) for x in value)
+    if isinstance(value, (list, tuple)):
+        return [_normalise(x) for x in value]
+    return force_text(value)
+
+
+def make_key(cache, searches):
+    """
+    Creates a key from what would be sent to the backends, so that any two
+    requests which would ask them the same thing share it, however their
+    query strings were written, and any which wouldn't, don't.
+
+    :param searches: ``(alias, SearchQuerySet)`` pairs, as provided by
+                     :py:meth:`~haystackbrowser.forms.PreSelectedModelSearchForm.search_connections`
+    """
+    items = []
+    for alias, sqs in searches:
+        query = sqs.query
+        items.append([force_text(alias), force_text(query.build_query())] +
+                     [_normalise(getattr(query, name, None))
+                      for name in QUERY_ATTRIBUTES])
+    data = json.dumps(items, separators=(',', ':'))
+    digest = hashlib.sha1(data.encode('utf-8')).hexdigest()
+    return 'haystackbrowser:page:%s:%s' % (get_generation(cache), digest)
+
+
+def freeze_result(result):
+    """
+    Turns a :py:class:`~haystack.models.SearchResult` into something which
+    can be pickled; the logger and site can't be, and any database object is
+    better fetched fresh.
+    """
+    state = result.__dict__.copy()
+    for name in ('log', 'searchsite', '_object'):
+        state.pop(name, None)
+    return result.__class__, state
+
+
+def thaw_result(frozen):
+    """
+    Reverses :py:func:`freeze_result`.
+    """
+    cls, state = frozen
+    result = cls.__new__(cls)
+    result.__dict__.update(state)
+    result._object = None
+    result.log = result._get_log()
+    config = get_haystack_config()
+    if config.version == 1:
+        result.searchsite = config.get_site()
+    return result
+
+
+def make_similar_key(cache, content_type, pk, using):
+    """
+    Creates the key for the results similar to one document, as found on
+    the given connection.
+    """
+    data = json.dumps([force_text(content_type), force_text(pk),
+                       force_text(using)], separators=(',', ':'))
+    digest = hashlib.sha1(data.encode('utf-8')).hexdigest()
+    return 'haystackbrowser:similar:%s:%s' % (get_generation(cache), digest)
+
+
+def get_results(cache, key):
+    """
+    :return: the list of results stored by :py:func:`set_results`, or `None`
+             if there aren't any.
+    """
+    frozen = cache.get(key)
+    if frozen is None:
+        return None
+    return [thaw_result(x) for x in frozen]
+
+
+def set_results(cache, key, results, timeout):
+    cache.set(key, [freeze_result(x) for x in results], timeout)
+
+
+class ResultCache(object):
+    """
+    Remembers the responses a paginator received for one search, keyed by
+    the range of results requested.
+    """
+    __slots__ = ('cache', 'key', 'timeout')
+
+    def __init__(self, cache, key, timeout):
+        self.cache = cache
+        self.key = key
+        self.timeout = timeout
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s key=%(key)s timeout=%(timeout)r>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'key': self.key,
+            'timeout': self.timeout,
+        }
+
+    def make_key(self, start, end):
+        return '%s:%d:%d' % (self.key, start, end)
+
+    def get(self, start, end):
+        """
+        :return: a tuple of the results, hit count and facet counts, and
+                 anything else the paginator stored with them, or `None`
+                 if they're not in the cache.
+        """
+        frozen = self.cache.get(self.make_key(start, end))
+        if frozen is None:
+            return None
+        return ([thaw_result(x) for x in frozen[0]],) + tuple(frozen[1:])
+
+    def set(self, start, end, response):
+        frozen = ([freeze_result(x) for x in response[0]],) + tuple(response[1:])
+        self.cache.set(self.make_key(start, end), frozen, self.timeout)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import csv
+import logging
+from collections import OrderedDict
+from django.core.serializers.json import DjangoJSONEncoder
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
+from haystackbrowser.utils import PY3
+
+
+logger = logging.getLogger(__name__)
+
+#: the columns written before the stored fields of each document.
+BASE_COLUMNS = ('content_type', 'pk', 'score')
+
+
+def get_row(result, fieldnames):
+    """
+    Extracts the values for a single
+    :py:class:`~haystack.models.SearchResult`, in the same order as
+    `fieldnames`. Stored fields the result's index doesn't have are `None`.
+    """
+    stored = result.get_stored_fields()
+    row = ['%s.%s' % (result.app_label, result.model_name), result.pk,
+           result.score]
+    row.extend(stored.get(name, None) for name in fieldnames)
+    return row
+
+
+class Echo(object):
+    """
+    Stands in for a file, so that :py:func:`csv.writer` hands back each
+    line it would've written, instead of buffering them.
+    """
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    value = force_text(value)
+    if not PY3:  # the python 2 csv module only deals in bytes.
+        return value.encode('utf-8')
+    return value
+
+
+def iter_csv(results, fieldnames):
+    """
+    Yields a header, and then one line of CSV for each result.
+
+    :param results: an iterable of :py:class:`~haystack.models.SearchResult`
+    :param fieldnames: the stored fields to include.
+    """
+    writer = csv.writer(Echo())
+    header = tuple(BASE_COLUMNS) + tuple(fieldnames)
+    yield writer.writerow([_csv_value(x) for x in header])
+    for result in results:
+        row = get_row(result, fieldnames)
+        yield writer.writerow([_csv_value(x) for x in row])
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        try:
+            return super(ExportJSONEncoder, self).default(o)
+        except TypeError:
+            return force_text(o)
+
+
+def iter_jsonl(results, fieldnames):
+    """
+    Yields one JSON object per line (`JSON Lines <http://jsonlines.org/>`_)
+    for each result.
+
+    :param results: an iterable of :py:class:`~haystack.models.SearchResult`
+    :param fieldnames: the stored fields to include.
+    """
+    header = tuple(BASE_COLUMNS) + tuple(fieldnames)
+    encoder = ExportJSONEncoder()
+    for result in results:
+        row = get_row(result, fieldnames)
+        yield encoder.encode(OrderedDict(zip(header, row))) + '\n'
+
+
+#: maps the format in the URL to the generator and content type used.
+FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
@@ -1,17 +1,19 @@
 import logging
+from operator import itemgetter
 from django.core.exceptions import ValidationError
 from django.http import QueryDict
 from django.template.defaultfilters import yesno
 from django.forms import (MultipleChoiceField, CheckboxSelectMultiple,
-                          ChoiceField, HiddenInput, IntegerField)
+                          HiddenInput, MultipleHiddenInput, IntegerField,
+                          CharField)
 from django.utils.translation import ugettext_lazy as _
 try:
     from django.forms.utils import ErrorDict
 except ImportError: # < Django 1.8
     from django.forms.util import ErrorDict
-from haystack.forms import ModelSearchForm, model_choices
+from haystack.forms import ModelSearchForm
 from haystackbrowser.models import AppliedFacets, Facet
-from haystackbrowser.utils import HaystackConfig
+from haystackbrowser.utils import get_haystack_config
 
 
 logger = logging.getLogger(__name__)
@@ -44,19 +46,25 @@ class PreSelectedModelSearchForm(ModelSearchForm):
     possible_facets = MultipleChoiceField(widget=CheckboxSelectMultiple,
                                           choices=(), required=False,
                                           label=_("Finding facets on"))
-    connection = ChoiceField(choices=(), required=False)
+    connection = MultipleChoiceField(widget=CheckboxSelectMultiple,
+                                     choices=(), required=False,
+                                     label=_("Connections"))
     p = IntegerField(required=False, label=_("Page"), min_value=0,
                      max_value=99999999, initial=1)
+    cursor = CharField(required=False, widget=HiddenInput)
 
     def __init__(self, *args, **kwargs):
         """
         If we're in a recognised faceting engine, display and allow faceting.
         """
-        super(PreSelectedModelSearchForm, self).__init__(*args, **kwargs)
-        if 'models' in self.fields:
-            self.fields['models'].initial = [x[0] for x in model_choices()]
-            self.fields['models'].label = _("Only models")
-        self.haystack_config = HaystackConfig()
+        # ModelSearchForm would work out the model choices from scratch,
+        # so it's skipped in favour of the remembered ones.
+        super(ModelSearchForm, self).__init__(*args, **kwargs)
+        self.haystack_config = get_haystack_config()
+        choices = self.get_model_choices()
+        self.fields['models'] = MultipleChoiceField(
+            choices=choices, required=False, label=_("Only models"),
+            widget=CheckboxSelectMultiple, initial=[x[0] for x in choices])
 
         self.version = self.haystack_config.version
         if self.should_allow_faceting():
@@ -69,9 +77,9 @@ class PreSelectedModelSearchForm(ModelSearchForm):
         if self.has_multiple_connections():
             wtf = self.get_possible_connections()
             self.fields['connection'].choices = tuple(wtf)  # noqa
-            self.fields['connection'].initial = 'default'
+            self.fields['connection'].initial = ['default']
         else:
-            self.fields['connection'].widget = HiddenInput()
+            self.fields['connection'].widget = MultipleHiddenInput()
 
     def is_haystack1(self):
         return self.haystack_config.is_version_1x()
@@ -88,12 +96,113 @@ class PreSelectedModelSearchForm(ModelSearchForm):
     def get_possible_connections(self):
         return self.haystack_config.get_connections()
 
+    def get_requested_connections(self):
+        """
+        The known connection aliases in the submitted data, or the default
+        connection if there aren't any. Unlike
+        :py:meth:`get_selected_connections`, this doesn't need the form to
+        be valid, so it can be used while setting the form up.
+        """
+        if self.is_bound and self.has_multiple_connections():
+            if hasattr(self.data, 'getlist'):
+                asked = self.data.getlist('connection')
+            else:
+                asked = self.data.get('connection', ())
+            possible = dict(self.get_possible_connections())
+            asked = [x.strip() for x in asked if x.strip() in possible]
+            if asked:
+                return asked
+        return ['default']
+
+    def get_model_choices(self):
+        """
+        The models indexed by the connections asked for, or by the default
+        connection if none were.
+
+        :return: tuple of ``app_label.model_name`` and name pairs.
+        """
+        aliases = self.get_requested_connections()
+        if len(aliases) == 1:
+            return self.haystack_config.get_model_choices(using=aliases[0])
+        choices = {}
+        for alias in aliases:
+            for value, label in self.haystack_config.get_model_choices(using=alias):
+                choices.setdefault(value, label)
+        return tuple(sorted(choices.items(), key=itemgetter(1)))
+
+    def get_selected_connections(self):
+        """
+        The connection aliases chosen, which may be none at all.
+        """
+        self.is_valid()
+        return getattr(self, 'cleaned_data', {}).get('connection', [])
+
+    def has_query(self):
+        """
+        Whether anything was entered to search for, rather than only
+        filtering by model or facet.
+        """
+        self.is_valid()
+        return any(getattr(self, 'cleaned_data', {}).get('q', ()))
+
+    def is_fan_out(self):
+        """
+        Whether the search should be run against more than one connection.
+        """
+        return (self.has_multiple_connections() and
+                len(self.get_selected_connections()) > 1)
+
+    def search_connections(self, sqs=None, include_facets=True,
+                           facet_options=None):
+        """
+        Provides the search for each selected connection.
+
+        :param sqs: the result of :py:meth:`search`, if it's already been
+                    called.
+        :type sqs: SearchQuerySet
+        :param include_facets: as for :py:meth:`search`.
+        :type include_facets: boolean
+        :param facet_options: given a connection's alias, provides the
+                              options for faceting on it, because each
+                              backend understands different ones. When
+                              searching several connections, each search is
+                              built again with its own options.
+        :type facet_options: callable
+
+        :return: a list of ``(alias, SearchQuerySet)`` pairs.
+        """
+        if not self.is_fan_out():
+            if sqs is None:
+                alias = (self.get_selected_connections() or ['default'])[0]
+                sqs = self.search(include_facets=include_facets,
+                                  facet_options=facet_options and
+                                  facet_options(alias))
+            return [(getattr(sqs.query, '_using', None) or 'default', sqs)]
+        if facet_options is None:
+            if sqs is None:
+                sqs = self.search(include_facets=include_facets)
+            return [(alias, sqs.using(alias))
+                    for alias in self.get_selected_connections()]
+        return [(alias, self.search(include_facets=include_facets,
+                                    facet_options=facet_options(alias)).using(alias))
+                for alias in self.get_selected_connections()]
+
     def configure_faceting(self):
-        possible_facets = self.haystack_config.get_facets(sqs=self.searchqueryset)
-        return [Facet(x).choices() for x in sorted(possible_facets)]
+        # when searching several connections, only the facets they all
+        # have can be counted.
+        possible_facets = None
+        for alias in self.get_requested_connections():
+            facets = set(self.haystack_config.get_facets(
+                sqs=self.searchqueryset, using=alias))
+            if possible_facets is None:
+                possible_facets = facets
+            else:
+                possible_facets &= facets
+        return [Facet(x).choices() for x in sorted(possible_facets or ())]
 
     def should_allow_faceting(self):
-        return self.haystack_config.supports_faceting()
+        return all(self.haystack_config.supports_faceting(using=alias)
+                   for alias in self.get_requested_connections())
 
     def __repr__(self):
         is_valid = self.is_bound and not bool(self._errors)
@@ -116,7 +225,17 @@ class PreSelectedModelSearchForm(ModelSearchForm):
         """
         return self.searchqueryset.all()
 
-    def search(self):
+    def search(self, include_facets=True, facet_options=None):
+        """
+        :param include_facets: whether to ask for counts of the facets in
+                               `possible_facets`, which may instead be
+                               requested one at a time.
+        :type include_facets: boolean
+        :param facet_options: passed along when faceting on each field, as
+                              provided by
+                              :py:meth:`~haystackbrowser.utils.HaystackConfig.get_facet_options`
+        :type facet_options: dictionary
+        """
         sqs = self.searchqueryset.all()
 
         if not self.is_valid():
@@ -137,10 +256,12 @@ class PreSelectedModelSearchForm(ModelSearchForm):
                 sqs = sqs.narrow(narrow_query)
 
             to_facet_on = sorted(cleaned_data.get('possible_facets', ()))
-            if len(to_facet_on) > 0:
+            if include_facets and len(to_facet_on) > 0:
                 for field in to_facet_on:
-                    sqs = sqs.facet(field)
+                    sqs = sqs.facet(field, **(facet_options or {}))
 
+        # no models at all means every model, which the backend can do
+        # without being told about any of them.
         only_models = self.get_models()
         if len(only_models) > 0:
             sqs = sqs.models(*only_models)
@@ -155,7 +276,7 @@ class PreSelectedModelSearchForm(ModelSearchForm):
         return sqs
 
     def clean_connection(self):
-        return [self.cleaned_data.get('connection', 'default').strip()]
+        return [x.strip() for x in self.cleaned_data.get('connection', ())]
 
     def clean_possible_facets(self):
         return list(frozenset(self.cleaned_data.get('possible_facets', ())))
@@ -166,6 +287,12 @@ class PreSelectedModelSearchForm(ModelSearchForm):
     def clean_q(self):
         return [self.cleaned_data.get('q', '')]
 
+    def clean_cursor(self):
+        cursor = self.cleaned_data.get('cursor', '').strip()
+        if cursor:
+            return [cursor]
+        return []
+
     def clean_p(self):
         page = self.cleaned_data.get('p', None)
         if page is None:
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Records the requests made to the search backends while one of the admin
+views runs, so that :py:class:`~haystackbrowser.admin.HaystackResultsAdmin`
+can show where the time on a page went, and pass it on to a hook.
+
+The backend classes are wrapped once, the first time they're needed, and
+the wrappers do nothing unless a :py:class:`Recorder` is active on the
+current thread.
+"""
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from importlib import import_module
+from threading import Lock, local
+from timeit import default_timer
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
+
+
+logger = logging.getLogger(__name__)
+
+_state = local()
+_instrumented = set()
+_instrumented_lock = Lock()
+
+
+class BackendCall(object):
+    """
+    A single request to a search backend. `seconds` is the whole call, of
+    which `parse_seconds` was spent turning the response into results;
+    the rest was spent building the request and waiting on the backend.
+    """
+    __slots__ = ('connection', 'method', 'query_string', 'hits', 'facets',
+                 'seconds', 'parse_seconds')
+
+    def __init__(self, connection, method, query_string, hits, facets,
+                 seconds, parse_seconds):
+        self.connection = connection
+        self.method = method
+        self.query_string = query_string
+        self.hits = hits
+        self.facets = facets
+        self.seconds = seconds
+        self.parse_seconds = parse_seconds
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s %(method)s on %(connection)s ' \
+               'hits=%(hits)r ms=%(ms)d>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'method': self.method,
+            'connection': self.connection,
+            'hits': self.hits,
+            'ms': self.milliseconds,
+        }
+
+    @property
+    def wire_seconds(self):
+        return max(self.seconds - self.parse_seconds, 0)
+
+    @property
+    def milliseconds(self):
+        return int(round(self.seconds * 1000))
+
+    @property
+    def wire_milliseconds(self):
+        return int(round(self.wire_seconds * 1000))
+
+    @property
+    def parse_milliseconds(self):
+        return int(round(self.parse_seconds * 1000))
+
+    def as_dict(self):
+        return OrderedDict((
+            ('connection', self.connection),
+            ('method', self.method),
+            ('query_string', self.query_string),
+            ('hits', self.hits),
+            ('facets', list(self.facets)),
+            ('seconds', self.seconds),
+            ('wire_seconds', self.wire_seconds),
+            ('parse_seconds', self.parse_seconds),
+        ))
+
+
+class Recorder(object):
+    """
+    Collects the :py:class:`BackendCall` instances made while it's active,
+    on whichever threads it was activated on, and how long each named
+    phase of the view took.
+
+    Use it as a context manager to activate it on the current thread, and
+    :py:meth:`bind` to carry it over to work done on another thread.
+    """
+    __slots__ = ('view', 'calls', 'phases', '_lock', '_previous')
+
+    def __init__(self, view=None):
+        self.view = view
+        self.calls = []
+        self.phases = OrderedDict()
+        self._lock = Lock()
+        self._previous = None
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s view=%(view)s calls=%(calls)d>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'view': self.view,
+            'calls': len(self.calls),
+        }
+
+    def __enter__(self):
+        self._previous = getattr(_state, 'recorder', None)
+        _state.recorder = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.recorder = self._previous
+        self._previous = None
+        return False
+
+    def add(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the body of the ``with`` statement, adding it to any time
+        already spent on the phase.
+        """
+        started = default_timer()
+        try:
+            yield
+        finally:
+            elapsed = default_timer() - started
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+
+    def bind(self, func):
+        """
+        Wraps `func` so that this recorder is active while it runs, on
+        whichever thread that is.
+        """
+        @wraps(func)
+        def bound(*args, **kwargs):
+            previous = getattr(_state, 'recorder', None)
+            _state.recorder = self
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _state.recorder = previous
+        return bound
+
+    @property
+    def seconds(self):
+        return sum(call.seconds for call in self.calls)
+
+    @property
+    def milliseconds(self):
+        return int(round(self.seconds * 1000))
+
+    def get_phase_milliseconds(self):
+        return [(name, int(round(seconds * 1000)))
+                for name, seconds in self.phases.items()]
+
+    def as_dict(self):
+        return OrderedDict((
+            ('view', self.view),
+            ('seconds', self.seconds),
+            ('phases', OrderedDict(self.phases)),
+            ('calls', [call.as_dict() for call in self.calls]),
+        ))
+
+
+def get_recorder():
+    """
+    :return: the :py:class:`Recorder` active on the current thread, or
+             `None`.
+    """
+    return getattr(_state, 'recorder', None)
+
+
+def bind(func):
+    """
+    Carries the current thread's recorder, if there is one, over to
+    wherever `func` ends up running, such as a thread pool.
+    """
+    recorder = get_recorder()
+    if recorder is None:
+        return func
+    return recorder.bind(func)
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the body of the ``with`` statement as part of the named phase of
+    the current thread's recorder, if there is one.
+    """
+    recorder = get_recorder()
+    if recorder is None:
+        yield
+        return
+    with recorder.phase(name):
+        yield
+
+
+def _describe_instance(model_instance):
+    opts = model_instance._meta
+    if hasattr(opts, 'model_name'):
+        model_key = opts.model_name
+    else:
+        model_key = opts.module_name
+    return 'more like %s.%s.%s' % (opts.app_label, model_key,
+                                   force_text(model_instance.pk))
+
+
+def _wrap_call(method, func, describe):
+    @wraps(func)
+    def wrapper(self, first, *args, **kwargs):
+        recorder = get_recorder()
+        if recorder is None:
+            return func(self, first, *args, **kwargs)
+        previous_parse = getattr(_state, 'parse_seconds', None)
+        _state.parse_seconds = 0
+        response = None
+        started = default_timer()
+        try:
+            response = func(self, first, *args, **kwargs)
+            return response
+        finally:
+            elapsed = default_timer() - started
+            hits = None
+            if isinstance(response, dict):
+                hits = response.get('hits', None)
+            recorder.add(BackendCall(
+                connection=getattr(self, 'connection_alias', 'default'),
+                method=method, query_string=describe(first), hits=hits,
+                facets=tuple(sorted(kwargs.get('facets', None) or ())),
+                seconds=elapsed, parse_seconds=_state.parse_seconds))
+            _state.parse_seconds = previous_parse
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _wrap_parse(func):
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_state, 'parse_seconds', None) is None:
+            return func(self, *args, **kwargs)
+        started = default_timer()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            _state.parse_seconds += default_timer() - started
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument(backend_class):
+    """
+    Wraps the backend class' ``search``, ``more_like_this`` and
+    ``_process_results`` methods, once, leaving alone any already wrapped
+    by way of a parent class.
+    """
+    wrappers = (
+        ('search', lambda func: _wrap_call('search', func, force_text)),
+        ('more_like_this', lambda func: _wrap_call(
+            'more_like_this', func, _describe_instance)),
+        ('_process_results', _wrap_parse),
+    )
+    with _instrumented_lock:
+        if backend_class in _instrumented:
+            return
+        for name, wrap in wrappers:
+            func = getattr(backend_class, name, None)
+            if func is None or getattr(func, 'instrumented', False) is True:
+                continue
+            setattr(backend_class, name, wrap(func))
+        _instrumented.add(backend_class)
+
+
+def instrument_connections(aliases):
+    """
+    Wraps the backend class of each of the given connections.
+    """
+    try:
+        from haystack import connections
+    except ImportError:  # Haystack 1.x only has the one backend.
+        from haystack import backend
+        instrument(backend.SearchBackend)
+        return
+    for alias in aliases:
+        instrument(type(connections[alias].get_backend()))
+
+
+def load_hook(hook):
+    """
+    :param hook: a callable, or the dotted path to one.
+    :return: the callable, or `None` if there's no hook.
+    """
+    if hook is None or callable(hook):
+        return hook
+    module_path, _, attr = force_text(hook).rpartition('.')
+    return getattr(import_module(module_path), attr)
+
+
+def log_backend_calls(request, recorder):
+    """
+    A hook for ``HAYSTACKBROWSER_INSTRUMENTATION_HOOK`` which logs every
+    call at the ``INFO`` level, with the numbers available to handlers
+    in the record's ``backend_call`` attribute.
+    """
+    for call in recorder.calls:
+        logger.info("%s on %s took %dms (%dms parsing) for %r hits",
+                    call.method, call.connection, call.milliseconds,
+                    call.parse_milliseconds, call.hits,
+                    extra={'request': request, 'view': recorder.view,
+                           'backend_call': call.as_dict()})
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import logging
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+from optparse import make_option
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections as db_connections
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
+from haystack.exceptions import NotHandled
+from haystack.query import SearchQuerySet
+try:
+    from haystack.constants import DJANGO_ID
+except ImportError:  # really old haystack, early in 1.2 series?
+    DJANGO_ID = 'django_id'
+from haystackbrowser.pagination import iter_results, run_query
+from haystackbrowser.utils import get_haystack_config, get_model_for_content_type
+
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of up to `size` items from `iterable`, without consuming
+    any more of it than that at a time.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = ("Compares the documents in the search index with the rows the "
+            "index is meant to contain, reporting documents whose row no "
+            "longer qualifies (orphaned) and rows which have no document "
+            "(missing).")
+    args = '<app_label.model_name app_label.model_name ...>'
+
+    if hasattr(BaseCommand, 'option_list'):  # < Django 1.10
+        option_list = BaseCommand.option_list + (
+            make_option('--using', dest='using', default='default',
+                        help='The Haystack connection to audit.'),
+            make_option('--batch-size', dest='batch_size', type='int',
+                        default=500,
+                        help='How many identifiers to compare at a time.'),
+            make_option('--workers', dest='workers', type='int', default=1,
+                        help='How many batches of a model to compare at '
+                             'the same time.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.model_name')
+        parser.add_argument('--using', dest='using', default='default',
+                            help='The Haystack connection to audit.')
+        parser.add_argument('--batch-size', dest='batch_size', type=int,
+                            default=500,
+                            help='How many identifiers to compare at a time.')
+        parser.add_argument('--workers', dest='workers', type=int, default=1,
+                            help='How many batches of a model to compare at '
+                                 'the same time.')
+
+    def handle(self, *labels, **options):
+        labels = labels or options.get('models', ())
+        self.using = options.get('using', 'default')
+        self.batch_size = options.get('batch_size', 500)
+        self.workers = options.get('workers', 1)
+        self.verbosity = int(options.get('verbosity', 1))
+        if self.batch_size < 1 or self.workers < 1:
+            raise CommandError("--batch-size and --workers must be positive")
+        self.config = get_haystack_config()
+
+        if labels:
+            models = [self.get_model(label) for label in labels]
+        else:
+            models = self.config.get_indexed_models(using=self.using)
+
+        pool = None
+        if self.workers > 1:
+            pool = ThreadPool(processes=self.workers)
+        try:
+            for model in models:
+                self.report(model, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def get_model(self, label):
+        model = get_model_for_content_type(label)
+        if model is None:
+            raise CommandError("Unknown model: %s" % label)
+        if model not in self.config.get_indexed_models(using=self.using):
+            raise CommandError("Model is not indexed: %s" % label)
+        return model
+
+    def get_searchqueryset(self, model):
+        sqs = SearchQuerySet()
+        if self.config.supports_multiple_connections():
+            sqs = sqs.using(self.using)
+        return sqs.models(model)
+
+    def iter_index_pks(self, model):
+        """
+        Yields the primary key of every document in the index for the model,
+        asking the backend for one batch at a time.
+        """
+        keyset = self.config.supports_keyset_pagination(using=self.using)
+        results = iter_results(
+            self.get_searchqueryset(model).all(), self.batch_size,
+            keyset=keyset, max_offset=self.config.get_max_offset(using=self.using))
+        for result in results:
+            yield force_text(result.pk)
+
+    def get_index_queryset(self, model):
+        """
+        The rows the index is meant to contain, which may deliberately leave
+        some out, such as unpublished ones.
+        """
+        try:
+            index = self.config.get_site(using=self.using).get_index(model)
+        except NotHandled:
+            return model._default_manager.all()
+        if self.config.version == 2:
+            return index.index_queryset(using=self.using)
+        return index.index_queryset()
+
+    def iter_db_pks(self, model):
+        """
+        Yields the primary key of every row the index should have a document
+        for, without caching the whole queryset.
+        """
+        pks = self.get_index_queryset(model).order_by('pk').values_list(
+            'pk', flat=True)
+        for pk in pks.iterator():
+            yield force_text(pk)
+
+    def db_pks_in(self, model, pks):
+        found = self.get_index_queryset(model).filter(pk__in=pks).values_list(
+            'pk', flat=True)
+        return set(force_text(pk) for pk in found)
+
+    def index_pks_in(self, model, pks):
+        sqs = self.get_searchqueryset(model).filter(
+            **{'%s__in' % DJANGO_ID: pks})
+        results, hits, facets = run_query(sqs, 0, len(pks))
+        return set(force_text(result.pk) for result in results)
+
+    def find_orphaned(self, model, pks):
+        """
+        Of the given document identifiers, those with no database row the
+        index should contain, including those which can't be a primary key
+        of the model at all, such as ones left over from before its type
+        changed.
+        """
+        field = model._meta.pk
+        converted = {}
+        for pk in pks:
+            try:
+                converted[pk] = field.to_python(pk)
+            except (ValidationError, ValueError, TypeError):
+                pass
+        try:
+            found = self.db_pks_in(model, list(converted.values()))
+        finally:
+            self.close_db_connections()
+        return sorted(set(pk for pk in pks if pk not in converted or
+                          force_text(converted[pk]) not in found))
+
+    def find_missing(self, model, pks):
+        """
+        Of the given database primary keys, those with no document.
+        """
+        return sorted(set(pks) - self.index_pks_in(model, pks))
+
+    def close_db_connections(self):
+        # connections are per-thread, and pool workers would otherwise
+        # leave theirs open.
+        if self.workers > 1:
+            for connection in db_connections.all():
+                connection.close()
+
+    def compare(self, func, model, chunks, pool):
+        """
+        Applies `func` to every chunk, `workers` chunks at a time, yielding
+        the differences found, so that no more than that many chunks are ever
+        in memory.
+        """
+        if pool is None:
+            for chunk in chunks:
+                for pk in func(model, chunk):
+                    yield pk
+            return
+        while True:
+            window = list(islice(chunks, self.workers))
+            if not window:
+                break
+            for result in pool.map(lambda chunk: func(model, chunk), window):
+                for pk in result:
+                    yield pk
+
+    def audit(self, model, pool=None):
+        """
+        Yields a tuple of ``orphaned`` and the document identifier for
+        each document whose row is gone, followed by ``missing`` and the
+        primary key of each row with no document.
+        """
+        orphaned = self.compare(
+            self.find_orphaned, model,
+            chunked(self.iter_index_pks(model), self.batch_size), pool)
+        for pk in orphaned:
+            yield 'orphaned', pk
+        missing = self.compare(
+            self.find_missing, model,
+            chunked(self.iter_db_pks(model), self.batch_size), pool)
+        for pk in missing:
+            yield 'missing', pk
+
+    def report(self, model, pool=None):
+        opts = model._meta
+        if hasattr(opts, 'model_name'):
+            model_key = opts.model_name
+        else:
+            model_key = opts.module_name
+        label = '%s.%s' % (opts.app_label, model_key)
+        counts = {'orphaned': 0, 'missing': 0}
+        for problem, pk in self.audit(model, pool):
+            counts[problem] += 1
+            if self.verbosity > 1:
+                self.stdout.write('  %s %s.%s\n' % (problem, label, pk))
+        self.stdout.write('%s: %d orphaned, %d missing\n' % (
+            label, counts['orphaned'], counts['missing']))
+        return counts
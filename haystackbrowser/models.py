@@ -6,9 +6,8 @@ try:
 except ImportError:  # > Python 3
     from django.utils.six.moves.urllib import parse
     quote_plus = parse.quote_plus
-from operator import itemgetter
-from itertools import groupby
 from collections import namedtuple
+from weakref import WeakKeyDictionary
 from django.db import models
 try:
     from django.utils.encoding import force_text
@@ -16,11 +15,8 @@ except ImportError:  # < Django 1.5
     from django.utils.encoding import force_unicode as force_text
 from django.utils.safestring import mark_safe
 from django.utils.html import strip_tags
-try:
-    from django.core.urlresolvers import NoReverseMatch, reverse
-except ImportError:  # >= Django 2.0
-    from django.urls import reverse, NoReverseMatch
 from django.utils.translation import ugettext_lazy as _
+from haystackbrowser.utils import get_admin_urls
 
 
 logger = logging.getLogger(__name__)
@@ -40,6 +36,38 @@ class HaystackResults(models.Model):
         verbose_name_plural = _('Search results')
 
 
+_model_attrs_by_index = WeakKeyDictionary()
+
+
+def get_model_attrs_for_index(searchindex):
+    """
+    Finds the `model_attr` of every field on a SearchIndex. That only depends
+    on the SearchIndex class, so it's worked out once per class and shared by
+    every result from that index.
+
+    :param searchindex: the SearchIndex instance.
+
+    :return: dictionary of field names and their `model_attr`.
+    """
+    index_class = type(searchindex)
+    try:
+        return _model_attrs_by_index[index_class]
+    except KeyError:
+        pass
+    outfields = {}
+    try:
+        fields = searchindex.fields
+    except:
+        fields = {}
+    else:
+        for key, field in fields.items():
+            has_model_attr = getattr(field, 'model_attr', None)
+            if has_model_attr is not None:
+                outfields[key] = force_text(has_model_attr)
+    _model_attrs_by_index[index_class] = outfields
+    return outfields
+
+
 class SearchResultWrapper(object):
     """Value object which consumes a standard Haystack SearchResult, and the current
     admin site, and exposes additional methods and attributes for displaying the data
@@ -50,10 +78,16 @@ class SearchResultWrapper(object):
     :param admin_site: the parent site instance.
     :type admin_site: AdminSite object
 
+    Field extraction is done at most once per instance, the first time it's
+    asked for, as templates tend to ask more than once.
     """
+    __slots__ = ('admin', 'object', '_stored_fields', '_additional_fields')
+
     def __init__(self, obj, admin_site=None):
         self.admin = admin_site
         self.object = obj
+        self._stored_fields = None
+        self._additional_fields = None
         if getattr(self.object, 'searchindex', None) is None:
             # < Haystack 1.2
             from haystack import site
@@ -70,6 +104,15 @@ class SearchResultWrapper(object):
             'pk': self.object.pk,
         }
 
+    def get_admin_urls(self):
+        """Finds all the admin URLs for this object's model, which are
+        resolved once per model, rather than for every result.
+
+        :return: :py:class:`~haystackbrowser.utils.AdminURLs`
+        """
+        return get_admin_urls(self.admin, self.object.app_label,
+                              self.object.model_name)
+
     def get_app_url(self):
         """Resolves a given object's app into a link to the app administration.
 
@@ -79,59 +122,38 @@ class SearchResultWrapper(object):
 
         :return: string or None
         """
-        try:
-            return reverse('%s:app_list' % self.admin, kwargs={
-                'app_label': self.object.app_label,
-            })
-        except NoReverseMatch:
-            return None
+        return self.get_admin_urls().app
 
     def get_model_url(self):
         """Generates a link to the changelist for a specific Model in the administration.
 
         :return: string or None
         """
-        try:
-            parts = (self.admin, self.object.app_label, self.object.model_name)
-            return reverse('%s:%s_%s_changelist' % parts)
-        except NoReverseMatch:
-            return None
+        return self.get_admin_urls().changelist
 
     def get_pk_url(self):
         """Generates a link to the edit page for a specific object in the administration.
 
         :return: string or None
         """
-        try:
-            parts = (self.admin, self.object.app_label, self.object.model_name)
-            return reverse('%s:%s_%s_change' % parts, args=(self.object.pk,))
-        except NoReverseMatch:
-            return None
+        return self.get_admin_urls().change_for(self.object.pk)
 
     def get_detail_url(self):
-        try:
-            urlname = '%s:haystackbrowser_haystackresults_change' % self.admin
-            return reverse(urlname, kwargs={
-                'content_type': '.'.join([self.object.app_label,
-                                          self.object.model_name]),
-                'pk': self.object.pk})
-        except NoReverseMatch:
-            return None
+        return self.get_admin_urls().detail_for(self.object.pk)
 
     def get_model_attrs(self):
-        outfields = {}
         try:
-            fields = self.object.searchindex.fields
+            searchindex = self.object.searchindex
         except:
-            fields = {}
-        else:
-            for key, field in fields.items():
-                has_model_attr = getattr(field, 'model_attr', None)
-                if has_model_attr is not None:
-                    outfields[key] = force_text(has_model_attr)
-        return outfields
+            return {}
+        return get_model_attrs_for_index(searchindex)
 
     def get_stored_fields(self):
+        if self._stored_fields is None:
+            self._stored_fields = self._get_stored_fields()
+        return self._stored_fields
+
+    def _get_stored_fields(self):
         stored_fields = {}
         model_attrs = self.get_model_attrs()
         for key, value in self.object.get_stored_fields().items():
@@ -150,6 +172,11 @@ class SearchResultWrapper(object):
 
         :return: dictionary of field names and values.
         """
+        if self._additional_fields is None:
+            self._additional_fields = self._get_additional_fields()
+        return self._additional_fields
+
+    def _get_additional_fields(self):
         additional_fields = {}
         stored_fields = self.get_stored_fields().keys()
         model_attrs = self.get_model_attrs()
@@ -188,7 +215,7 @@ class SearchResultWrapper(object):
         :return: the count of all stored fields.
         :rtype: integer
         """
-        return len(self.object.get_stored_fields().keys())
+        return len(self.get_stored_fields())
 
     def get_additional_field_count(self):
         """
@@ -198,9 +225,13 @@ class SearchResultWrapper(object):
         :return: the count of all stored fields.
         :rtype: integer
         """
-        return len(self.get_additional_fields().keys())
+        return len(self.get_additional_fields())
 
     def __getattr__(self, attr):
+        # an unset slot (eg: while unpickling) must not go looking on
+        # self.object, which may itself be unset.
+        if attr in SearchResultWrapper.__slots__:
+            raise AttributeError(attr)
         return getattr(self.object, attr)
 
     def app_label(self):
@@ -210,14 +241,40 @@ class SearchResultWrapper(object):
             return self.object.app_label
 
 
+class FacetValue(namedtuple('FacetValue', 'value count fieldvalue')):
+    """
+    A single value of a facet, its count, and the quoted ``field:value``
+    used for selecting it.
+    """
+    __slots__ = ()
+
+
+class FacetGroup(namedtuple('FacetGroup', 'grouper list truncated')):
+    """
+    All the values for one facet field, in the order the backend gave them.
+    `grouper` is the :py:class:`Facet` for the field, and `list` is a
+    tuple of :py:class:`FacetValue`. `truncated` is `True` if there were
+    more values than the wrapper's limit.
+    """
+    __slots__ = ()
+
+
 class FacetWrapper(object):
     """
     A simple wrapper around `sqs.facet_counts()` to filter out things with
     0, and re-arrange the data in such a way that the template can handle it.
+
+    The grouping is done once, here, because the backend already groups the
+    values by field, and the template asks for them more than once.
+
+    If `limit` is given, only that many values are kept for each field, for
+    backends which didn't limit them already.
     """
-    __slots__ = ('dates', 'fields', 'queries', '_total_count', '_querydict')
+    __slots__ = ('dates', 'fields', 'queries', '_total_count', '_querydict',
+                 '_groups', 'limit')
 
-    def __init__(self, facet_counts, querydict):
+    def __init__(self, facet_counts, querydict, limit=None):
+        self.limit = limit
         self.dates = facet_counts.get('dates', {})
         self.fields = facet_counts.get('fields', {})
         self.queries = facet_counts.get('queries', {})
@@ -228,6 +285,11 @@ class FacetWrapper(object):
         if querydict is not None and page_key in querydict:
             querydict.pop(page_key)
         self._querydict = querydict
+        self._groups = {
+            'dates': self._group(self.dates),
+            'fields': self._group(self.fields),
+            'queries': self._group(self.queries),
+        }
 
     def __repr__(self):
         return '<%(module)s.%(cls)s fields=%(fields)r dates=%(dates)r ' \
@@ -239,33 +301,53 @@ class FacetWrapper(object):
             'queries': self.queries,
         }
 
-    def get_facets_from(self, x):
-        if x not in ('dates', 'queries', 'fields'):
-            raise AttributeError('Wrong field, silly.')
-
-        for field, items in getattr(self, x).items():
+    def _group(self, facet_counts):
+        groups = []
+        for field in sorted(facet_counts):
+            items = facet_counts[field]
+            if not isinstance(items, (list, tuple)):
+                # query facets are a count for the query itself.
+                items = ((field, items),)
+            values = []
+            truncated = False
             for content, count in items:
-                content = content.strip()
+                content = force_text(content).strip()
                 if count > 0 and content:
-                    yield {'field': field, 'value': content, 'count': count,
-                           'fieldvalue': quote_plus('%s:%s' % (field, content)),
-                           'facet': Facet(field, querydict=self._querydict)}
+                    if self.limit is not None and len(values) >= self.limit:
+                        truncated = True
+                        break
+                    fieldvalue = '%s:%s' % (field, content)
+                    values.append(FacetValue(
+                        content, count, quote_plus(fieldvalue.encode('utf-8'))))
+            if values:
+                groups.append(FacetGroup(Facet(field, querydict=self._querydict),
+                                         tuple(values), truncated))
+        return tuple(groups)
+
+    def get_facets_from(self, x):
+        """
+        The same values as :py:meth:`get_grouped_facets_from`, one at a
+        time, as the dictionaries earlier versions provided.
+        """
+        for group in self.get_grouped_facets_from(x):
+            for value in group.list:
+                yield {'field': group.grouper.fieldname, 'value': value.value,
+                       'count': value.count, 'fieldvalue': value.fieldvalue,
+                       'facet': group.grouper}
 
     def get_grouped_facets_from(self, x):
-        data = sorted(self.get_facets_from(x), key=itemgetter('field'))
-        #return data
-        results = ({'grouper': Facet(key), 'list': list(val)}
-                   for key, val in groupby(data, key=itemgetter('field')))
-        return results
+        if x not in ('dates', 'queries', 'fields'):
+            raise AttributeError('Wrong field, silly.')
+        return self._groups[x]
 
     def get_field_facets(self):
-        return self.get_grouped_facets_from('fields')
+        return self._groups['fields']
 
     def get_date_facets(self):
-        return self.get_grouped_facets_from('dates')
+        return self._groups['dates']
 
     def get_query_facets(self):
-        return self.get_grouped_facets_from('queries')
+        return self._groups['queries']
 
     def __bool__(self):
         """
@@ -366,10 +448,11 @@ class Facet(object):
     Takes a facet field name, like `thing_exact`
     """
 
-    __slots__ = ('fieldname', '_querydict')
+    __slots__ = ('fieldname', '_querydict', '_link')
     def __init__(self, fieldname, querydict=None):
         self.fieldname = fieldname
         self._querydict = querydict
+        self._link = None
 
     def __repr__(self):
         return '<%(module)s.%(cls)s - %(field)s>' % {
@@ -379,10 +462,14 @@ class Facet(object):
         }
 
     def link(self):
-        qd = self._querydict
-        if qd is not None:
-            return '?%s' % qd.urlencode()
-        return '?'
+        # the template asks once for every value of the facet.
+        if self._link is None:
+            qd = self._querydict
+            if qd is not None:
+                self._link = '?%s' % qd.urlencode()
+            else:
+                self._link = '?'
+        return self._link
 
     def get_display(self):
         return self.fieldname.replace('_', ' ').title()
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+import base64
+import heapq
+import json
+import logging
+from itertools import islice
+from math import ceil
+from timeit import default_timer
+from django.core.paginator import InvalidPage, EmptyPage, Paginator, Page
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
+try:
+    from haystack.constants import ID, DJANGO_CT, DJANGO_ID
+except ImportError:  # really old haystack, early in 1.2 series?
+    ID = 'id'
+    DJANGO_CT = 'django_ct'
+    DJANGO_ID = 'django_id'
+from haystackbrowser.instrumentation import bind
+
+
+logger = logging.getLogger(__name__)
+
+CURSOR_VAR = 'cursor'
+
+
+def get_result_identifier(result):
+    """
+    The unique document identifier of a result, as stored in the index,
+    which may have been made by a custom ``HAYSTACK_IDENTIFIER_METHOD``.
+    Backends which don't return it get the default one.
+    """
+    identifier = getattr(result, ID, None)
+    if identifier:
+        return force_text(identifier)
+    return '%s.%s.%s' % (result.app_label, result.model_name, result.pk)
+
+
+def run_query(sqs, start, end):
+    """
+    Executes a single request against the backend for the results between
+    `start` and `end`, without touching the `SearchQuerySet` result cache,
+    which would otherwise pre-allocate a slot for every hit in the index.
+
+    :return: a tuple of the results, the total hit count and facet counts,
+             all taken from the same response.
+    """
+    query = sqs.query._clone()
+    query.set_limits(start, end)
+    results = sqs.post_process_results(query.get_results())
+    return results, query.get_count(), query.get_facet_counts()
+
+
+def fetch_documents(sqs, content_type, pks):
+    """
+    Fetches the documents for several objects of the same model with a
+    single request, rather than one request per object.
+
+    :param content_type: ``app_label.model_name``, as stored in the index.
+    :param pks: the primary keys, as stored in the index.
+    :return: the results found, in whatever order the backend gave them.
+    """
+    pks = list(pks)
+    sqs = sqs.filter(**{DJANGO_CT: content_type, '%s__in' % DJANGO_ID: pks})
+    results, hits, facets = run_query(sqs, 0, len(pks))
+    return results
+
+
+def has_facets(sqs):
+    """
+    Whether the query asks the backend for any kind of facet counts; if
+    not, there's no point in asking for them.
+    """
+    query = sqs.query
+    return bool(query.facets or query.date_facets or query.query_facets)
+
+
+def encode_cursor(position):
+    """
+    Turns a dictionary describing where the next page starts into an
+    opaque string suitable for a querystring.
+    """
+    data = json.dumps(position, sort_keys=True, separators=(',', ':'))
+    encoded = base64.urlsafe_b64encode(data.encode('utf-8'))
+    return force_text(encoded).rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Reverses :py:func:`encode_cursor`.
+
+    :raises InvalidPage: if the token has been tampered with or is otherwise
+                         not something we made.
+    """
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        data = base64.urlsafe_b64decode(padded.encode('ascii'))
+        position = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise InvalidPage("Invalid cursor %r: %s" % (token, e))
+    if not isinstance(position, dict):
+        raise InvalidPage("Invalid cursor %r" % token)
+    return position
+
+
+class SearchPaginator(Paginator):
+    """
+    A :py:class:`~django.core.paginator.Paginator` for
+    :py:class:`~haystack.query.SearchQuerySet` instances which never asks
+    the backend for a separate count.
+
+    The standard paginator validates the requested page against
+    ``count`` before slicing, which costs one request to the backend
+    for the count, and another for the page itself. Search backends
+    always return the total number of hits alongside the results, so this
+    fetches the page first, and takes the count from the same response.
+    The facet counts from that response are kept as ``facet_counts``.
+
+    If `approximate_after` is given, and there are more hits than that, the
+    count is displayed as (for example) **10,000+**, and pages beyond it are
+    not offered, because deep offsets are where backends get slow (and
+    Elasticsearch refuses to go beyond 10,000 by default).
+
+    If `result_cache` is given (see :py:class:`~haystackbrowser.cache.ResultCache`)
+    responses are looked for there before asking the backend.
+    """
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, approximate_after=None,
+                 result_cache=None):
+        super(SearchPaginator, self).__init__(
+            object_list=object_list, per_page=per_page, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page)
+        self.approximate_after = approximate_after
+        self.result_cache = result_cache
+        self.facet_counts = None
+        self._hit_count = None
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s per_page=%(per_page)d count=%(count)r>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'per_page': self.per_page,
+            'count': self._hit_count,
+        }
+
+    def _check_object_list_is_ordered(self):
+        # Results are ordered by the backend, by score, unless otherwise
+        # requested.
+        return None
+
+    def fetch(self, start, end):
+        """
+        :return: a tuple of the results between `start` and `end`, the total
+                 hit count and facet counts.
+        """
+        return run_query(self.object_list, start, end)
+
+    def cached_fetch(self, start, end):
+        if self.result_cache is None:
+            return self.fetch(start, end)
+        response = self.result_cache.get(start, end)
+        if response is None:
+            response = self.fetch(start, end)
+            self.result_cache.set(start, end, response)
+        return response
+
+    @property
+    def count(self):
+        if self._hit_count is None:
+            # Something wants the count before any page was requested.
+            results, self._hit_count, self.facet_counts = self.cached_fetch(0, 1)
+        return self._hit_count
+
+    @property
+    def is_approximate(self):
+        return (self.approximate_after is not None and
+                self.count > self.approximate_after)
+
+    @property
+    def display_count(self):
+        if self.is_approximate:
+            return '{0:,}+'.format(self.approximate_after)
+        return self.count
+
+    @property
+    def num_pages(self):
+        count = self.count
+        if self.is_approximate:
+            count = self.approximate_after
+        if count == 0 and not self.allow_empty_first_page:
+            return 0
+        hits = max(1, count - self.orphans)
+        return int(ceil(hits / float(self.per_page)))
+
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        if self.approximate_after is not None:
+            if (number - 1) * self.per_page >= self.approximate_after:
+                raise EmptyPage('That page is beyond the approximate count')
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page + self.orphans
+        results, self._hit_count, self.facet_counts = self.cached_fetch(
+            bottom, top)
+        # the orphans were only fetched in case this is the last page.
+        if bottom + len(results) < self._hit_count:
+            results = results[:self.per_page]
+        if not results and not (number == 1 and self.allow_empty_first_page):
+            raise EmptyPage('That page contains no results')
+        return Page(results, number, self)
+
+
+def _merge_values(counts, by_count=True):
+    totals = {}
+    for values in counts:
+        for value, count in values:
+            totals[value] = totals.get(value, 0) + count
+    if by_count:
+        return sorted(totals.items(), key=lambda x: (-x[1], x[0]))
+    return sorted(totals.items())
+
+
+def merge_facet_counts(facet_counts):
+    """
+    Combines the facet counts from several backends into one, adding
+    together the counts for the same field and value, or the same query.
+    Field facets are ordered by count, and date facets by date.
+    """
+    fields = {}
+    dates = {}
+    queries = {}
+    for counts in facet_counts:
+        counts = counts or {}
+        for field, values in counts.get('fields', {}).items():
+            fields.setdefault(field, []).append(values)
+        for field, values in counts.get('dates', {}).items():
+            dates.setdefault(field, []).append(values)
+        for query, count in counts.get('queries', {}).items():
+            queries[query] = queries.get(query, 0) + count
+    return {
+        'fields': dict((field, _merge_values(values))
+                       for field, values in fields.items()),
+        'dates': dict((field, _merge_values(values, by_count=False))
+                      for field, values in dates.items()),
+        'queries': queries,
+    }
+
+
+class ConnectionTiming(object):
+    """
+    How long a single connection took to respond, as reported by
+    :py:class:`FanOutPaginator`.
+    """
+    __slots__ = ('alias', 'seconds', 'hits')
+
+    def __init__(self, alias, seconds, hits):
+        self.alias = alias
+        self.seconds = seconds
+        self.hits = hits
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s alias=%(alias)s ms=%(ms)d hits=%(hits)d>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'alias': self.alias,
+            'ms': self.milliseconds,
+            'hits': self.hits,
+        }
+
+    @property
+    def milliseconds(self):
+        return int(round(self.seconds * 1000))
+
+
+class FanOutPaginator(SearchPaginator):
+    """
+    Paginates the same search run against several connections at once.
+
+    `object_list` should be a sequence of ``(alias, SearchQuerySet)`` pairs.
+    Each page asks every connection, concurrently on `pool`, for everything
+    up to the end of the page, and then merges the responses by score,
+    because the page can only be known once every connection has had its say.
+    How long each connection took is kept as ``timings``; when the page
+    comes from `result_cache`, they're those of the original request.
+    """
+    def __init__(self, object_list, per_page, pool, **kwargs):
+        super(FanOutPaginator, self).__init__(object_list=object_list,
+                                              per_page=per_page, **kwargs)
+        self.pool = pool
+        self.timings = ()
+
+    def fetch(self, start, end):
+        def timed(args):
+            alias, sqs = args
+            started = default_timer()
+            response = run_query(sqs, 0, end)
+            return ConnectionTiming(alias, default_timer() - started,
+                                    response[1]), response
+        responses = self.pool.map(bind(timed), self.object_list)
+        self.timings = tuple(timing for timing, response in responses)
+        # the position within each response breaks ties in score, so the
+        # results themselves are never compared.
+        decorated = [[((-(result.score or 0), index, position), result)
+                      for position, result in enumerate(response[0])]
+                     for index, (timing, response) in enumerate(responses)]
+        merged = islice(heapq.merge(*decorated), start, end)
+        results = [result for key, result in merged]
+        hits = sum(response[1] for timing, response in responses)
+        facets = merge_facet_counts(response[2] for timing, response in responses)
+        return results, hits, facets
+
+    def cached_fetch(self, start, end):
+        if self.result_cache is None:
+            return self.fetch(start, end)
+        response = self.result_cache.get(start, end)
+        if response is None:
+            response = self.fetch(start, end)
+            # keeping the timings means a cached page still shows them.
+            self.result_cache.set(start, end, response + (self.timings,))
+            return response
+        results, hits, facets = response[:3]
+        if len(response) > 3:
+            self.timings = response[3]
+        return results, hits, facets
+
+
+class CursorPage(object):
+    """
+    A single page of results, as yielded by :py:class:`CursorPaginator`.
+    Exposes only forward movement, because that's all a search-after
+    style position can provide. `count` is every hit, including those on
+    earlier pages, and `remaining` those after this page.
+    """
+    __slots__ = ('object_list', 'number', 'count', 'remaining', 'next_cursor',
+                 'facet_counts', 'paginator')
+
+    def __init__(self, object_list, number, remaining, next_cursor,
+                 facet_counts, paginator, count=None):
+        self.object_list = object_list
+        self.number = number
+        self.count = count
+        self.remaining = remaining
+        self.next_cursor = next_cursor
+        self.facet_counts = facet_counts
+        self.paginator = paginator
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s page=%(page)d next=%(next)r>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'page': self.number,
+            'next': self.next_cursor,
+        }
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(object):
+    """
+    Moves through a :py:class:`~haystack.query.SearchQuerySet` using an opaque
+    cursor token rather than a page number.
+
+    When `keyset` is `True`, results are ordered by the unique document
+    identifier, rather than by relevance, and each subsequent page asks the
+    backend only for documents whose identifier sorts after the last one
+    seen. This is the same approach
+    as Solr's `cursorMark` and Elasticsearch's `search_after`, so the backend
+    never has to skip over `start` documents, and deep pages cost the same as
+    the first one.
+
+    Backends which cannot do a range query against the identifier get an
+    offset stored in the token instead. That includes Elasticsearch, where
+    the identifier is analyzed text, so sorting on it gives no total order.
+    If `max_offset` is given, no page goes beyond it, because backends such
+    as Elasticsearch refuse to.
+    """
+    def __init__(self, sqs, per_page, keyset=False, max_offset=None):
+        self.per_page = per_page
+        self.keyset = keyset
+        self.max_offset = max_offset
+        if keyset:
+            sqs = sqs.order_by(ID)
+        self.sqs = sqs
+
+    def __repr__(self):
+        return '<%(module)s.%(cls)s per_page=%(per_page)d keyset=%(keyset)s>' % {
+            'module': self.__class__.__module__,
+            'cls': self.__class__.__name__,
+            'per_page': self.per_page,
+            'keyset': self.keyset,
+        }
+
+    def narrow_after(self, sqs, last_id):
+        escaped = last_id.replace('\\', '\\\\').replace('"', '\\"')
+        return sqs.narrow('%s:{"%s" TO *}' % (ID, escaped))
+
+    def page(self, cursor=None, allow_empty=False):
+        """
+        :param cursor: a token previously provided by
+                       :py:attr:`CursorPage.next_cursor`, or `None` for the
+                       first page.
+        :type cursor: string
+        :param allow_empty: whether a page after the first may be empty,
+                            as it can be if documents were removed since
+                            the cursor was made.
+        :type allow_empty: boolean
+
+        :return: :py:class:`CursorPage`
+        :raises InvalidPage: if the cursor isn't valid.
+        """
+        position = {}
+        if cursor:
+            position = decode_cursor(cursor)
+        try:
+            number = int(position.get('page', 1))
+            offset = int(position.get('offset', 0))
+            # how many results came before, which with a keyset the
+            # backend doesn't know.
+            seen = int(position.get('seen', offset))
+        except (TypeError, ValueError):
+            raise InvalidPage("Invalid cursor %r" % cursor)
+        if number < 1 or offset < 0 or seen < 0:
+            raise InvalidPage("Invalid cursor %r" % cursor)
+
+        sqs = self.sqs
+        last_id = position.get('after', None)
+        narrowed = self.keyset and last_id is not None
+        if narrowed:
+            sqs = self.narrow_after(sqs, force_text(last_id))
+            offset = 0
+
+        end = offset + self.per_page
+        if not narrowed and self.max_offset is not None:
+            end = min(end, self.max_offset)
+        if end > offset:
+            results, hits, facets = run_query(sqs, offset, end)
+        else:
+            results, hits, facets = [], 0, None
+        # facets from a narrowed query only cover what's after the cursor,
+        # so they're not worth showing.
+        if narrowed:
+            facets = None
+        if number > 1 and not results and not allow_empty:
+            raise InvalidPage("That cursor contains no results")
+
+        # with a keyset, the hit count is everything after the cursor.
+        if self.keyset:
+            remaining = hits - len(results)
+        else:
+            remaining = hits - offset - len(results)
+
+        next_cursor = None
+        if remaining > 0 and results:
+            next_position = {'page': number + 1}
+            if self.keyset:
+                next_position['after'] = get_result_identifier(results[-1])
+                next_position['seen'] = seen + len(results)
+            else:
+                next_position['offset'] = offset + len(results)
+            if (self.keyset or self.max_offset is None or
+                    next_position['offset'] < self.max_offset):
+                next_cursor = encode_cursor(next_position)
+        remaining = max(remaining, 0)
+        return CursorPage(object_list=results, number=number,
+                          count=seen + len(results) + remaining,
+                          remaining=remaining,
+                          next_cursor=next_cursor, facet_counts=facets,
+                          paginator=self)
+
+
+def iter_results(sqs, batch_size, keyset=False, max_offset=None):
+    """
+    Yields every result for the given :py:class:`~haystack.query.SearchQuerySet`,
+    asking the backend for `batch_size` at a time, so that only one batch is
+    ever held in memory, however many hits there are.
+
+    Stops quietly if a batch comes back empty, such as when documents are
+    removed part of the way through, because whatever is consuming the
+    results may already have sent some of them on.
+
+    :param keyset: whether the backend supports the range queries required by
+                   :py:class:`CursorPaginator` to avoid deep offsets.
+    :type keyset: boolean
+    :param max_offset: how far into the results the backend will go,
+                       without `keyset`; anything beyond it is left out,
+                       with a warning.
+    :type max_offset: integer
+    """
+    paginator = CursorPaginator(sqs, per_page=batch_size, keyset=keyset,
+                                max_offset=max_offset)
+    cursor = None
+    while True:
+        page = paginator.page(cursor, allow_empty=True)
+        for result in page.object_list:
+            yield result
+        if not page.has_next():
+            if page.object_list and page.remaining > 0:
+                logger.warning("Stopped after %d results, leaving out %d, "
+                               "because the backend won't go any deeper",
+                               max_offset, page.remaining)
+            break
+        cursor = page.next_cursor
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from haystack.signals import RealtimeSignalProcessor
+from haystackbrowser.cache import invalidate
+
+
+class InvalidateResultCacheMixin(object):
+    """
+    Forgets every cached result page (see ``HAYSTACKBROWSER_CACHE``) whenever
+    an indexed model is saved or deleted. Mix into whichever Haystack signal
+    processor is in use; requires Haystack 2.x.
+    """
+    def is_indexed(self, sender, instance):
+        for using in self.connection_router.for_write(instance=instance):
+            unified_index = self.connections[using].get_unified_index()
+            if sender in unified_index.get_indexed_models():
+                return True
+        return False
+
+    def handle_save(self, sender, instance, **kwargs):
+        super(InvalidateResultCacheMixin, self).handle_save(
+            sender=sender, instance=instance, **kwargs)
+        if self.is_indexed(sender, instance):
+            invalidate()
+
+    def handle_delete(self, sender, instance, **kwargs):
+        super(InvalidateResultCacheMixin, self).handle_delete(
+            sender=sender, instance=instance, **kwargs)
+        if self.is_indexed(sender, instance):
+            invalidate()
+
+
+class InvalidatingRealtimeSignalProcessor(InvalidateResultCacheMixin,
+                                          RealtimeSignalProcessor):
+    """
+    Haystack's own `RealtimeSignalProcessor`, which also invalidates the
+    result page cache. To use it::
+
+        HAYSTACK_SIGNAL_PROCESSOR = 'haystackbrowser.signals.InvalidatingRealtimeSignalProcessor'
+    """
+    pass
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
 from classytags.arguments import Argument
-from classytags.core import Options
+from classytags.core import Options, Tag
 from classytags.helpers import InclusionTag
 from django import template
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
 from haystack.query import SearchQuerySet
 from haystackbrowser.models import SearchResultWrapper
+from haystackbrowser.pagination import fetch_documents
 from haystackbrowser.utils import get_haystack_settings
 
 try:
@@ -16,6 +22,76 @@ except ImportError:
 
 register = template.Library()
 
+#: where the results fetched by :py:class:`HaystackBrowserPrefetch` are kept,
+#: on the request if there is one, otherwise for the current render.
+PREFETCHED_ATTR = '_haystackbrowser_prefetched'
+
+
+def get_document_key(obj):
+    """
+    :return: the content type and primary key of a model instance, as
+             they're stored in the index.
+    """
+    opts = obj._meta
+    if hasattr(opts, 'model_name'):
+        model_key = opts.model_name
+    else:
+        model_key = opts.module_name
+    return '%s.%s' % (opts.app_label, model_key), force_text(obj.pk)
+
+
+def get_prefetched(context):
+    """
+    :return: a dictionary of :py:func:`get_document_key` to the wrapped
+             result, or `None` if the object isn't in the index, for every
+             object prefetched so far.
+    """
+    request = context.get('request')
+    if request is not None:
+        prefetched = getattr(request, PREFETCHED_ATTR, None)
+        if prefetched is None:
+            prefetched = {}
+            setattr(request, PREFETCHED_ATTR, prefetched)
+        return prefetched
+    if PREFETCHED_ATTR not in context.render_context:
+        context.render_context[PREFETCHED_ATTR] = {}
+    return context.render_context[PREFETCHED_ATTR]
+
+
+def prefetch_results(prefetched, objs):
+    """
+    Fetches the index data for every object not already in `prefetched`,
+    with one query per model.
+    """
+    pks_by_content_type = OrderedDict()
+    for obj in objs:
+        key = get_document_key(obj)
+        if key in prefetched:
+            continue
+        prefetched[key] = None
+        pks_by_content_type.setdefault(key[0], []).append(key[1])
+    for content_type, pks in pks_by_content_type.items():
+        for result in fetch_documents(SearchQuerySet(), content_type, pks):
+            key = (content_type, force_text(result.pk))
+            prefetched[key] = SearchResultWrapper(obj=result)
+    return prefetched
+
+
+class HaystackBrowserPrefetch(Tag):
+    """
+    Fetch the search index data for all of the given model objects at once,
+    so that any :py:class:`HaystackBrowserForObject` for them, later in the
+    same request, doesn't have to ask the backend itself. Renders nothing.
+    """
+    options = Options(
+        Argument('objs', required=True, resolve=True),
+    )
+
+    def render_tag(self, context, objs):
+        prefetch_results(get_prefetched(context), objs)
+        return ''
+
+
 class HaystackBrowserForObject(InclusionTag):
     """
     Render a template which shows the given model object's data in the haystack
@@ -27,12 +103,17 @@ class HaystackBrowserForObject(InclusionTag):
     )
 
     def get_context(self, context, obj):
-        object_id = obj.pk
-        content_type_id = '%s.%s' % (obj._meta.app_label, obj._meta.module_name)
-        query = {DJANGO_ID: object_id, DJANGO_CT: content_type_id}
+        content_type_id, object_id = get_document_key(obj)
         output_context = {
             'haystack_settings': get_haystack_settings(),
         }
+        prefetched = get_prefetched(context)
+        if (content_type_id, object_id) in prefetched:
+            result = prefetched[(content_type_id, object_id)]
+            if result is not None:
+                output_context.update(original=result)
+            return output_context
+        query = {DJANGO_ID: object_id, DJANGO_CT: content_type_id}
         try:
             result = SearchQuerySet().filter(**query)[:1][0]
             result = SearchResultWrapper(obj=result)
@@ -41,4 +122,5 @@ class HaystackBrowserForObject(InclusionTag):
             pass
         return output_context
 
+register.tag('haystackbrowser_prefetch', HaystackBrowserPrefetch)
 register.tag('haystackbrowser_for_object', HaystackBrowserForObject)
@@ -3,15 +3,22 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import division
+import json
+import threading
 import django
 import pytest
 from functools import partial
 from django.conf import settings
+try:
+    from django.utils.encoding import force_text
+except ImportError:  # < Django 1.5
+    from django.utils.encoding import force_unicode as force_text
 try:
     from django.core.urlresolvers import reverse, resolve
 except ImportError:  # >= Django 2.0
     from django.urls import reverse, resolve
 from haystack.exceptions import SearchBackendError
+from haystack.models import SearchResult
 from haystackbrowser.admin import Search404
 from haystackbrowser.forms import PreSelectedModelSearchForm
 from haystackbrowser.models import SearchResultWrapper
@@ -131,3 +138,458 @@ def test_GH15_detailview_mlt_attributeerror_is_handled(mocker, detailview):
     # it should not be promoted to a userland exception and should instead
     # be silenced...
     detailview()
+
+
+@pytest.yield_fixture
+def adminview(admin_user, rf):
+    """
+    Calls one of the admin views, by the end of its URL name, as a
+    superuser, with `data` as the query string and `kwargs` as the URL's.
+    """
+    def make_request(name, data=None, **kwargs):
+        url = reverse('admin:haystackbrowser_haystackresults_%s' % name,
+                      kwargs=kwargs or None)
+        request = rf.get(url, data or {})
+        request.user = admin_user
+        match = resolve(url)
+        return match.func(request, *match.args, **match.kwargs)
+    yield make_request
+
+
+@pytest.yield_fixture
+def listview(adminview, mocker):
+    choices = [('auth.user', 'Users')]
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_model_choices',
+                 return_value=choices)
+    yield lambda **data: adminview('changelist', data)
+
+
+@skip_old_haystack
+def test_listview_makes_one_backend_request(mocker, listview):
+    """
+    The results, the hit count and the facet counts should all be taken from
+    the same response.
+    """
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {
+        'results': [mocker.Mock(), mocker.Mock()],
+        'hits': 42,
+        'facets': {'fields': {'author': [('bob', 3), ('alice', 1)]}},
+    }
+    response = listview(models='auth.user', connection='default', p='1')
+    assert search.call_count == 1
+    assert len(response.context_data['results']) == 2
+    assert response.context_data['result_count'] == 42
+    assert response.context_data['page_num'] == 2
+    assert response.context_data['cl'].result_count == 42
+    assert len(response.context_data['facets']) == 1
+
+
+@skip_old_haystack
+def test_listview_without_models_searches_everything(mocker, listview):
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {'results': [], 'hits': 0}
+    response = listview(q='hi')
+    assert response.status_code == 200
+    assert search.call_count == 1
+    assert 'models' not in search.call_args[1]
+
+
+@skip_old_haystack
+def test_export_streams_in_batches(adminview, mocker, settings):
+    settings.HAYSTACKBROWSER_EXPORT_BATCH_SIZE = 2
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_stored_fields',
+                 return_value=('text',))
+
+    def make_result(pk):
+        result = mocker.Mock(app_label='auth', model_name='user', pk=pk,
+                             score=1)
+        result.get_stored_fields.return_value = {'text': 'doc %d' % pk}
+        return result
+
+    def fake_search(query_string, start_offset, end_offset, **kwargs):
+        pks = range(start_offset + 1, min(end_offset, 5) + 1)
+        return {'results': [make_result(pk) for pk in pks], 'hits': 5}
+    search = mocker.patch(
+        'haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+        side_effect=fake_search)
+    response = adminview('export', {'connection': 'default'},
+                         export_format='csv')
+    assert response.streaming is True
+    assert search.call_count == 0
+    lines = [force_text(x) for x in response.streaming_content]
+    assert lines[0] == 'content_type,pk,score,text\r\n'
+    assert lines[-1] == 'auth.user,5,1,doc 5\r\n'
+    assert len(lines) == 6
+    assert search.call_count == 3
+
+
+@skip_old_haystack
+def test_export_does_not_count_facets(adminview, mocker):
+    mocker.patch('haystackbrowser.utils.HaystackConfig.supports_faceting',
+                 return_value=True)
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_facets',
+                 return_value=('author',))
+    search = mocker.patch(
+        'haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+        return_value={'results': [], 'hits': 0})
+    response = adminview('export', {'connection': 'default',
+                                    'possible_facets': 'author'},
+                         export_format='jsonl')
+    assert list(response.streaming_content) == []
+    assert search.call_count == 1
+    assert 'facets' not in search.call_args[1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detailview_finds_similar_objects_concurrently(mocker, admin_user,
+                                                       adminview):
+    threads = []
+    def mlt(instance):
+        threads.append(threading.current_thread())
+        return [mocker.Mock()]
+    mocker.patch('haystack.query.SearchQuerySet.filter').return_value = [mocker.Mock()]
+    mocker.patch('haystack.query.SearchQuerySet.more_like_this', side_effect=mlt)
+    response = adminview('change', content_type='auth.user', pk=admin_user.pk)
+    assert threads != [threading.current_thread()]
+    assert len(response.context_data['similar_objects']) == 1
+    assert response.context_data['original'].object.object == admin_user
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detailview_skips_similar_objects_without_row(mocker, adminview):
+    mocker.patch('haystack.query.SearchQuerySet.filter').return_value = [mocker.Mock()]
+    mlt = mocker.patch('haystack.query.SearchQuerySet.more_like_this')
+    response = adminview('change', content_type='auth.user', pk=9999)
+    assert mlt.called is False
+    assert response.context_data['similar_objects'] == ()
+
+
+@skip_old_haystack
+def test_listview_fans_out_to_each_connection(mocker, listview):
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.side_effect = [
+        {'results': [mocker.Mock(score=2.0), mocker.Mock(score=0.5)], 'hits': 2},
+        {'results': [mocker.Mock(score=1.0)], 'hits': 1},
+    ]
+    response = listview(models='auth.user', connection=['default', 'other'])
+    assert search.call_count == 2
+    scores = [x.object.score for x in response.context_data['results']]
+    assert scores == [2.0, 1.0, 0.5]
+    assert response.context_data['result_count'] == 3
+    timings = response.context_data['connection_timings']
+    assert sorted(x.alias for x in timings) == ['default', 'other']
+
+
+class FakeIndex(object):
+    fields = {}
+
+
+class PicklableResult(SearchResult):
+    searchindex = FakeIndex()
+
+
+@skip_old_haystack
+def test_listview_uses_result_cache(mocker, listview, settings):
+    settings.HAYSTACKBROWSER_CACHE = 'default'
+    from haystackbrowser.cache import get_cache
+    get_cache().clear()
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {
+        'results': [PicklableResult('auth', 'user', '1', 1.0)],
+        'hits': 1,
+    }
+    first = listview(models='auth.user', connection='default', q='hi')
+    second = listview(connection='default', q='hi', models='auth.user')
+    assert search.call_count == 1
+    assert [x.object.pk for x in second.context_data['results']] == ['1']
+    assert second.context_data['result_count'] == 1
+    listview(models='auth.user', connection='default', q='bye')
+    assert search.call_count == 2
+    get_cache().clear()
+
+
+@skip_old_haystack
+def test_listview_invalid_form_is_not_cached(mocker, listview, settings):
+    settings.HAYSTACKBROWSER_CACHE = 'default'
+    from haystackbrowser.cache import get_cache
+    get_cache().clear()
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {
+        'results': [PicklableResult('auth', 'user', '1', 1.0)],
+        'hits': 1,
+    }
+    listview(connection='default', q='hi', p='-1')
+    assert search.call_count == 1
+    listview(connection='default', q='hi')
+    assert search.call_count == 2
+    assert search.call_args[0][0] != '*:*'
+    get_cache().clear()
+
+
+class StoredResult(PicklableResult):
+    def get_stored_fields(self):
+        return {'name': self.name}
+
+
+@skip_old_haystack
+def test_compareview_one_query_per_model(mocker, adminview):
+    def search(query_string, **kwargs):
+        if 'group' in query_string:
+            return {'results': [StoredResult('auth', 'group', '3', 1.0,
+                                             name='staff')], 'hits': 1}
+        return {'results': [StoredResult('auth', 'user', '2', 1.0, name='bob'),
+                            StoredResult('auth', 'user', '1', 1.0, name='bob')],
+                'hits': 2}
+    backend = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+                           side_effect=search)
+    response = adminview('compare', {'ids': [
+        'auth.user.1', 'auth.group.3', 'auth.user.2', 'auth.user.1',
+        'auth.user.9', 'nonsense']})
+    assert backend.call_count == 2
+    documents = response.context_data['documents']
+    assert [(x.model_name, x.pk) for x in documents] == [
+        ('user', '1'), ('group', '3'), ('user', '2')]
+    assert response.context_data['missing'] == ['auth.user.9']
+    key, values, differs = response.context_data['rows'][0]
+    assert key == 'name'
+    assert [x['raw'] for x in values] == ['bob', 'staff', 'bob']
+    assert differs is True
+
+
+def test_compareview_needs_ids(adminview):
+    with pytest.raises(Search404):
+        adminview('compare')
+
+
+@pytest.yield_fixture
+def get_detail(adminview, admin_user):
+    def make_request(name='change', pk=None, **data):
+        return adminview(name, data, content_type='auth.user',
+                         pk=pk or admin_user.pk)
+    yield make_request
+
+
+@skip_old_haystack
+@pytest.mark.django_db(transaction=True)
+def test_detailview_caches_similar_objects(mocker, get_detail, settings):
+    settings.HAYSTACKBROWSER_CACHE = 'default'
+    from haystackbrowser.cache import get_cache
+    get_cache().clear()
+    mocker.patch('haystack.query.SearchQuerySet.filter').return_value = [mocker.Mock()]
+    mlt = mocker.patch('haystack.query.SearchQuerySet.more_like_this')
+    mlt.return_value = [PicklableResult('auth', 'user', '2', 0.5)]
+    get_detail()
+    response = get_detail()
+    assert mlt.call_count == 1
+    assert [x.object.pk for x in response.context_data['similar_objects']] == ['2']
+    get_cache().clear()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detailview_defers_similar_objects(mocker, get_detail, settings):
+    settings.HAYSTACKBROWSER_DEFER_SIMILAR = True
+    mocker.patch('haystack.query.SearchQuerySet.filter').return_value = [mocker.Mock()]
+    mlt = mocker.patch('haystack.query.SearchQuerySet.more_like_this')
+    mlt.return_value = [PicklableResult('auth', 'user', '2', 0.5)]
+    response = get_detail(q='hi')
+    assert mlt.called is False
+    assert response.context_data['similar_objects'] == ()
+    assert response.context_data['similar_objects_url'] == 'similar/?q=hi'
+
+    response = get_detail(name='similar', q='hi')
+    assert mlt.call_count == 1
+    data = json.loads(response.content.decode('utf-8'))
+    assert [(x['content_type'], x['pk'], x['score']) for x in data['values']] == [
+        ('auth.user', '2', 0.5)]
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('lookup,pk,called', [
+    ('exists', None, True),
+    ('exists', 9999, False),
+    ('identifier', 9999, True),
+])
+def test_detailview_similar_objects_without_loading_row(mocker, admin_user,
+                                                        get_detail, settings,
+                                                        lookup, pk, called):
+    settings.HAYSTACKBROWSER_SIMILAR_LOOKUP = lookup
+    mocker.patch('haystack.query.SearchQuerySet.filter').return_value = [mocker.Mock()]
+    mlt = mocker.patch('haystack.query.SearchQuerySet.more_like_this')
+    get_object = mocker.patch('haystackbrowser.admin.get_object_or_none')
+    get_detail(pk=pk)
+    assert get_object.called is False
+    assert mlt.called is called
+    if called:
+        instance = mlt.call_args[0][0]
+        assert force_text(instance.pk) == force_text(pk or admin_user.pk)
+        assert instance.username == ''
+
+
+@pytest.yield_fixture
+def facetview(adminview, mocker):
+    mocker.patch('haystackbrowser.utils.HaystackConfig.supports_faceting',
+                 return_value=True)
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_facets',
+                 return_value=('author',))
+    yield lambda field, **data: adminview('facets', data, field=field)
+
+
+@skip_old_haystack
+def test_facetview_returns_one_field(mocker, facetview, settings):
+    settings.HAYSTACKBROWSER_FACET_LIMIT = 2
+    settings.HAYSTACKBROWSER_FACET_MINCOUNT = 2
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {
+        'results': [], 'hits': 10,
+        'facets': {'fields': {'author': [('bob', 3), ('alice', 1),
+                                         ('carol', 5), ('dave', 2)]}},
+    }
+    response = facetview('author', connection='default', q='hi')
+    assert search.call_count == 1
+    assert search.call_args[1]['facets'] == {'author': {}}
+    data = json.loads(response.content.decode('utf-8'))
+    assert data['field'] == 'author'
+    assert [(x['value'], x['count']) for x in data['values']] == [('carol', 5),
+                                                                  ('bob', 3)]
+    assert 'selected_facets=author%3Acarol' in data['values'][0]['link']
+    assert 'q=hi' in data['values'][0]['link']
+
+
+@skip_old_haystack
+def test_facetview_prefix_and_truncated(mocker, facetview, settings):
+    settings.HAYSTACKBROWSER_FACET_LIMIT = 1
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {
+        'results': [], 'hits': 10,
+        'facets': {'fields': {'author': [('bob', 3), ('alice', 1),
+                                         ('bert', 2)]}},
+    }
+    response = facetview('author', connection='default', prefix='b')
+    data = json.loads(response.content.decode('utf-8'))
+    assert data['prefix'] == 'b'
+    assert [x['value'] for x in data['values']] == ['bob']
+    assert data['truncated'] is True
+
+
+@skip_old_haystack
+def test_facetview_unknown_field(facetview):
+    with pytest.raises(Search404):
+        facetview('nope', connection='default')
+
+
+@skip_old_haystack
+def test_listview_lazy_facets_are_not_requested(mocker, listview, settings):
+    settings.HAYSTACKBROWSER_LAZY_FACETS = True
+    mocker.patch('haystackbrowser.utils.HaystackConfig.supports_faceting',
+                 return_value=True)
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_facets',
+                 return_value=('author',))
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {'results': [], 'hits': 0}
+    response = listview(models='auth.user', connection='default',
+                        possible_facets='author')
+    assert search.call_args[1].get('facets') is None
+    assert [x.fieldname for x in response.context_data['lazy_facets']] == ['author']
+
+
+@pytest.fixture
+def instrumentable(mocker):
+    """
+    Lets the backend be instrumented afresh, putting back the methods that
+    were wrapped once the test is done, so other tests don't record calls.
+    """
+    from haystack.backends.whoosh_backend import WhooshSearchBackend
+    mocker.patch('haystackbrowser.instrumentation._instrumented', set())
+    for name in ('search', 'more_like_this', '_process_results'):
+        mocker.patch.object(WhooshSearchBackend, name,
+                            getattr(WhooshSearchBackend, name))
+
+
+@skip_old_haystack
+def test_listview_records_backend_calls(mocker, listview, settings,
+                                        instrumentable):
+    hook = mocker.Mock()
+    settings.HAYSTACKBROWSER_INSTRUMENTATION_HOOK = hook
+    # wrap the mocked search, rather than whatever was there before.
+    mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+                 return_value={'results': [mocker.Mock()], 'hits': 1})
+    render = mocker.patch('django.template.response.TemplateResponse.render')
+    response = listview(models='auth.user', q='hi')
+    assert render.call_count == 1
+    recorder = response.context_data['backend_calls']
+    call, = recorder.calls
+    assert call.connection == 'default'
+    assert call.method == 'search'
+    assert call.hits == 1
+    assert list(recorder.phases) == ['wrap', 'view', 'render']
+    hook.assert_called_once_with(mocker.ANY, recorder)
+
+
+@skip_old_haystack
+def test_listview_survives_unimportable_hook(mocker, listview, settings,
+                                            instrumentable):
+    settings.HAYSTACKBROWSER_INSTRUMENTATION_HOOK = 'haystackbrowser.nope.hook'
+    mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+                 return_value={'results': [], 'hits': 0})
+    mocker.patch('django.template.response.TemplateResponse.render')
+    warning = mocker.patch('haystackbrowser.admin.logger.warning')
+    response = listview(models='auth.user')
+    assert response.status_code == 200
+    assert warning.call_count == 1
+    assert warning.call_args[0] == ("Instrumentation hook could not be loaded",)
+    assert warning.call_args[1]['exc_info'] == 1
+
+
+@skip_old_haystack
+def test_listview_survives_failing_hook(mocker, listview, settings,
+                                        instrumentable):
+    hook = mocker.Mock(side_effect=ValueError)
+    settings.HAYSTACKBROWSER_INSTRUMENTATION_HOOK = hook
+    mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+                 return_value={'results': [], 'hits': 0})
+    mocker.patch('django.template.response.TemplateResponse.render')
+    warning = mocker.patch('haystackbrowser.admin.logger.warning')
+    response = listview(models='auth.user')
+    assert response.status_code == 200
+    assert hook.call_count == 1
+    assert warning.call_count == 1
+    assert warning.call_args[0][1] is hook
+
+
+@skip_old_haystack
+def test_listview_not_instrumented_by_default(mocker, listview):
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {'results': [], 'hits': 0}
+    response = listview(models='auth.user')
+    assert response.context_data['backend_calls'] is None
+    assert response.is_rendered is False
+
+
+@skip_old_haystack
+@pytest.mark.parametrize('q, keyset', [('', True), ('hi', False)])
+def test_listview_cursor_keeps_relevance_order(mocker, listview, settings,
+                                               q, keyset):
+    settings.HAYSTACKBROWSER_CURSOR_PAGINATION = True
+    mocker.patch('haystackbrowser.utils.HaystackConfig.supports_keyset_pagination',
+                 return_value=True)
+    search = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search')
+    search.return_value = {'results': [mocker.Mock(score=1)] * 2, 'hits': 7}
+    response = listview(connection='default', q=q)
+    assert ('sort_by' in search.call_args[1]) is keyset
+    assert response.context_data['result_count'] == 7
+    assert response.context_data['remaining_count'] == 7 - 2
+
+
+def test_facet_links_start_from_the_first_page(rf):
+    from django.contrib import admin
+    from haystackbrowser.models import HaystackResults
+    model_admin = admin.site._registry[HaystackResults]
+    request = rf.get('/', {'q': 'hi', 'p': '2', 'cursor': 'abc',
+                           'selected_facets': 'author:bob'})
+    form = PreSelectedModelSearchForm(request.GET, load_all=False)
+    querydict = model_admin.get_facet_querydict(request, form)
+    assert 'cursor' in form.cleaned_data_querydict
+    assert 'cursor' not in querydict
+    assert 'p' not in querydict
+    assert querydict.getlist('q') == ['hi']
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import pytest
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils.six import StringIO
+from haystack.models import SearchResult
+from haystackbrowser.management.commands.haystackbrowser_audit import (
+    Command, chunked)
+
+
+def test_chunked_is_lazy():
+    consumed = []
+    def numbers():
+        for x in range(5):
+            consumed.append(x)
+            yield x
+    chunks = chunked(numbers(), 2)
+    assert next(chunks) == [0, 1]
+    assert consumed == [0, 1]
+    assert list(chunks) == [[2, 3], [4]]
+
+
+@pytest.fixture
+def audit(mocker):
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_indexed_models',
+                 return_value=(User,))
+    def run(indexed, **options):
+        mocker.patch.object(Command, 'iter_index_pks',
+                            side_effect=lambda model: iter(indexed))
+        mocker.patch.object(Command, 'index_pks_in',
+                            side_effect=lambda model, pks: set(indexed) & set(pks))
+        out = StringIO()
+        call_command('haystackbrowser_audit', 'auth.user', stdout=out,
+                     verbosity=2, **options)
+        return out.getvalue().splitlines()
+    return run
+
+
+def audit_users():
+    users = [User.objects.create(username='user%d' % x) for x in range(5)]
+    pks = [str(user.pk) for user in users]
+    # the last user is unindexed, and there's a document for a deleted one.
+    return pks, pks[:-1] + ['999']
+
+
+@pytest.mark.django_db
+def test_audit_reports_orphaned_and_missing(audit):
+    pks, indexed = audit_users()
+    lines = audit(indexed, batch_size=2)
+    assert lines == ['  orphaned auth.user.999',
+                     '  missing auth.user.%s' % pks[-1],
+                     'auth.user: 1 orphaned, 1 missing']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_audit_with_workers(audit):
+    pks, indexed = audit_users()
+    lines = audit(indexed, batch_size=2, workers=3)
+    assert lines[-1] == 'auth.user: 1 orphaned, 1 missing'
+
+
+@pytest.mark.django_db
+def test_audit_uses_index_queryset(audit, mocker):
+    pks, indexed = audit_users()
+    # the unindexed user is deliberately left out of the index.
+    site = mocker.patch('haystackbrowser.utils.HaystackConfig.get_site')
+    index_queryset = site.return_value.get_index.return_value.index_queryset
+    index_queryset.side_effect = lambda **kwargs: User.objects.exclude(
+        pk=pks[-1])
+    lines = audit(indexed, batch_size=2)
+    assert lines == ['  orphaned auth.user.999',
+                     'auth.user: 1 orphaned, 0 missing']
+    if settings.OLD_HAYSTACK is False:
+        assert index_queryset.call_args[1] == {'using': 'default'}
+
+
+@pytest.mark.django_db
+def test_audit_counts_unconvertible_identifiers_as_orphaned(audit):
+    pks, indexed = audit_users()
+    lines = audit(indexed + ['not-a-pk'], batch_size=10)
+    assert lines == ['  orphaned auth.user.999',
+                     '  orphaned auth.user.not-a-pk',
+                     '  missing auth.user.%s' % pks[-1],
+                     'auth.user: 2 orphaned, 1 missing']
+
+
+@pytest.mark.django_db
+def test_audit_against_backend(mocker):
+    pks, indexed = audit_users()
+    documents = [SearchResult('auth', 'user', pk, 1) for pk in
+                 indexed + ['not-a-pk']]
+    def search(query_string, start_offset=0, end_offset=None, **kwargs):
+        found = [document for document in documents
+                 if query_string == '*' or '"%s"' % document.pk in query_string]
+        return {'results': found[start_offset:end_offset], 'hits': len(found)}
+    backend = mocker.patch(
+        'haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+        side_effect=search)
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_indexed_models',
+                 return_value=(User,))
+    out = StringIO()
+    call_command('haystackbrowser_audit', 'auth.user', stdout=out,
+                 verbosity=2, batch_size=2)
+    assert out.getvalue().splitlines() == [
+        '  orphaned auth.user.999',
+        '  orphaned auth.user.not-a-pk',
+        '  missing auth.user.%s' % pks[-1],
+        'auth.user: 2 orphaned, 1 missing']
+    # paged through the whole index, then looked up each batch of rows.
+    assert backend.call_count == 3 + 3
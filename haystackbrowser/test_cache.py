@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import pickle
+import pytest
+from django.conf import settings
+from haystack.models import SearchResult
+from haystackbrowser.cache import (ResultCache, freeze_result, get_cache,
+                                   invalidate, make_key, thaw_result)
+try:
+    from unittest.mock import Mock
+except ImportError:  # < python 3.3
+    from mock import Mock
+
+skip_old_haystack = pytest.mark.skipif(settings.OLD_HAYSTACK is True,
+                                       reason="Doesn't apply to Haystack 1.2.x")
+
+
+@pytest.fixture
+def cache(settings):
+    settings.HAYSTACKBROWSER_CACHE = 'default'
+    cache = get_cache()
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_cache_is_off_by_default():
+    assert get_cache() is None
+
+
+@pytest.fixture
+def searches():
+    from django.contrib.auth.models import Group, User
+    from haystack.query import SearchQuerySet
+
+    def make_searches(q='a', models=(User, Group), **facet_options):
+        sqs = SearchQuerySet().models(*models).auto_query(q)
+        if facet_options:
+            sqs = sqs.facet('author', **facet_options)
+        return [('default', sqs)]
+    return make_searches
+
+
+@skip_old_haystack
+def test_key_ignores_ordering(cache, searches):
+    from django.contrib.auth.models import Group, User
+    first = make_key(cache, searches(models=(User, Group)))
+    assert first == make_key(cache, searches(models=(Group, User)))
+    assert first != make_key(cache, searches(q='b'))
+    assert first != make_key(cache, searches(models=(User,)))
+
+
+@skip_old_haystack
+def test_key_includes_facet_options(cache, searches):
+    assert make_key(cache, searches(limit=10)) != make_key(cache,
+                                                           searches(limit=20))
+
+
+@skip_old_haystack
+def test_invalidate_changes_keys(cache, searches):
+    before = make_key(cache, searches())
+    invalidate()
+    assert make_key(cache, searches()) != before
+
+
+def test_result_survives_pickling():
+    result = SearchResult('auth', 'user', '1', 1.5, text='hello')
+    frozen = pickle.loads(pickle.dumps(freeze_result(result)))
+    thawed = thaw_result(frozen)
+    assert thawed.pk == '1'
+    assert thawed.score == 1.5
+    assert thawed.text == 'hello'
+    assert thawed.log is not None
+
+
+def test_result_cache_roundtrip(cache):
+    results = [SearchResult('auth', 'user', '1', 1.5)]
+    facets = {'fields': {'a': [('b', 1)]}}
+    result_cache = ResultCache(cache, 'test', timeout=60)
+    assert result_cache.get(0, 10) is None
+    result_cache.set(0, 10, (results, 5, facets))
+    cached_results, hits, cached_facets = result_cache.get(0, 10)
+    assert [x.pk for x in cached_results] == ['1']
+    assert hits == 5
+    assert cached_facets == facets
+    assert result_cache.get(10, 20) is None
+
+
+@skip_old_haystack
+def test_signal_processor_invalidates_for_indexed_models(mocker, cache,
+                                                         searches):
+    from haystackbrowser.signals import InvalidateResultCacheMixin
+
+    class Base(object):
+        def handle_save(self, sender, instance, **kwargs):
+            pass
+
+    class Processor(InvalidateResultCacheMixin, Base):
+        connection_router = Mock(**{'for_write.return_value': ['default']})
+        connections = mocker.MagicMock()
+
+    processor = Processor()
+    processor.connections['default'].get_unified_index.return_value\
+        .get_indexed_models.return_value = [str]
+    before = make_key(cache, searches())
+    processor.handle_save(sender=int, instance=1)
+    assert make_key(cache, searches()) == before
+    processor.handle_save(sender=str, instance='1')
+    assert make_key(cache, searches()) != before
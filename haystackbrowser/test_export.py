@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import json
+from haystackbrowser.export import iter_csv, iter_jsonl
+try:
+    from unittest.mock import Mock
+except ImportError:  # < python 3.3
+    from mock import Mock
+
+
+def make_result(pk, **stored):
+    result = Mock(app_label='auth', model_name='user', pk=pk, score=1.5)
+    result.get_stored_fields.return_value = stored
+    return result
+
+
+def test_csv_has_header_and_a_line_per_result():
+    results = [make_result(1, text='hello, world'), make_result(2)]
+    lines = list(iter_csv(iter(results), ('text',)))
+    assert lines == ['content_type,pk,score,text\r\n',
+                     'auth.user,1,1.5,"hello, world"\r\n',
+                     'auth.user,2,1.5,\r\n']
+
+
+def test_jsonl_is_one_object_per_line():
+    results = [make_result(1, text='hello'), make_result(2, text=['a', 'b'])]
+    lines = list(iter_jsonl(iter(results), ('text',)))
+    assert len(lines) == 2
+    assert all(line.endswith('\n') for line in lines)
+    assert json.loads(lines[1]) == {'content_type': 'auth.user', 'pk': 2,
+                                    'score': 1.5, 'text': ['a', 'b']}
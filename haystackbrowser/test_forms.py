@@ -143,3 +143,67 @@ def test_get_possible_connections_version2():
             ('default', 'lol'),
             ('other', 'other'),
         ]
+
+
+@skip_old_haystack
+def test_is_fan_out_version2():
+    form = PreSelectedModelSearchForm(data={'connection': ['default', 'other']})
+    assert form.is_fan_out() is True
+    assert [x[0] for x in form.search_connections()] == ['default', 'other']
+    form = PreSelectedModelSearchForm(data={'connection': ['other']})
+    assert form.is_fan_out() is False
+    assert [x[0] for x in form.search_connections()] == ['other']
+
+
+def test_has_query():
+    assert PreSelectedModelSearchForm(data={'q': 'hi'}).has_query() is True
+    assert PreSelectedModelSearchForm(data={'q': ''}).has_query() is False
+    assert PreSelectedModelSearchForm(data=None).has_query() is False
+
+
+@skip_old_haystack
+def test_search_connections_facet_options_per_connection(mocker):
+    mocker.patch('haystackbrowser.utils.HaystackConfig.supports_faceting',
+                 return_value=True)
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_facets',
+                 return_value=('author',))
+    form = PreSelectedModelSearchForm(data={'connection': ['default', 'other'],
+                                            'possible_facets': ['author']})
+    options = {'default': {'limit': 5}, 'other': {'size': 5}}
+    searches = form.search_connections(facet_options=options.get)
+    assert [(alias, sqs.query._using, list(sqs.query.facets.values()))
+            for alias, sqs in searches] == [('default', 'default', [{'limit': 5}]),
+                                            ('other', 'other', [{'size': 5}])]
+
+
+@skip_old_haystack
+def test_model_choices_follow_connections_version2(mocker):
+    by_connection = {
+        'default': (('auth.user', 'Users'),),
+        'other': (('auth.group', 'Groups'), ('auth.user', 'Users')),
+    }
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_model_choices',
+                 side_effect=lambda using: by_connection[using])
+    form = PreSelectedModelSearchForm()
+    assert form.fields['models'].initial == ['auth.user']
+    form = PreSelectedModelSearchForm(data={'connection': ['default', 'other']})
+    assert list(form.fields['models'].choices) == [('auth.group', 'Groups'),
+                                                   ('auth.user', 'Users')]
+    form = PreSelectedModelSearchForm(data={'connection': ['nope']})
+    assert list(form.fields['models'].choices) == [('auth.user', 'Users')]
+
+
+@skip_old_haystack
+def test_faceting_follows_connections_version2(mocker):
+    supported = {'default': True, 'other': False}
+    facets = {'default': ('a', 'b'), 'other': ('b', 'c')}
+    mocker.patch('haystackbrowser.utils.HaystackConfig.supports_faceting',
+                 side_effect=lambda using: supported[using])
+    mocker.patch('haystackbrowser.utils.HaystackConfig.get_facets',
+                 side_effect=lambda sqs, using: facets[using])
+    form = PreSelectedModelSearchForm(data={'connection': ['default']})
+    assert form.should_allow_faceting() is True
+    assert [x[0] for x in form.configure_faceting()] == ['a', 'b']
+    form = PreSelectedModelSearchForm(data={'connection': ['default', 'other']})
+    assert form.should_allow_faceting() is False
+    assert [x[0] for x in form.configure_faceting()] == ['b']
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import threading
+from multiprocessing.pool import ThreadPool
+import pytest
+from django.contrib.auth.models import User
+from haystackbrowser.instrumentation import (Recorder, _instrumented, bind,
+                                             get_recorder, instrument,
+                                             load_hook, log_backend_calls)
+
+
+class FakeBackend(object):
+    connection_alias = 'other'
+
+    def search(self, query_string, **kwargs):
+        return {'results': self._process_results(query_string), 'hits': 3}
+
+    def more_like_this(self, model_instance, **kwargs):
+        return {'results': [], 'hits': 0}
+
+    def _process_results(self, raw_results):
+        return [raw_results] * 3
+
+
+class FakeChildBackend(FakeBackend):
+    pass
+
+
+@pytest.yield_fixture(scope='module', autouse=True)
+def instrumented():
+    original = dict((name, FakeBackend.__dict__[name])
+                    for name in ('search', 'more_like_this', '_process_results'))
+    instrument(FakeBackend)
+    instrument(FakeChildBackend)
+    yield
+    for name, func in original.items():
+        setattr(FakeBackend, name, func)
+    _instrumented.discard(FakeBackend)
+    _instrumented.discard(FakeChildBackend)
+
+
+def test_records_each_call():
+    backend = FakeBackend()
+    with Recorder(view='index') as recorder:
+        assert get_recorder() is recorder
+        backend.search('hello', facets=['b', 'a'])
+        backend.more_like_this(User(pk=4))
+    assert get_recorder() is None
+    search, mlt = recorder.calls
+    assert search.connection == 'other'
+    assert search.method == 'search'
+    assert search.query_string == 'hello'
+    assert search.hits == 3
+    assert search.facets == ('a', 'b')
+    assert 0 < search.parse_seconds <= search.seconds
+    assert search.wire_seconds == search.seconds - search.parse_seconds
+    assert mlt.method == 'more_like_this'
+    assert mlt.query_string == 'more like auth.user.4'
+    assert mlt.hits == 0
+    assert mlt.parse_seconds == 0
+
+
+def test_nothing_recorded_without_recorder():
+    recorder = Recorder()
+    assert FakeBackend().search('hello')['hits'] == 3
+    assert recorder.calls == []
+    assert bind(len) is len
+
+
+def test_inherited_methods_are_wrapped_once():
+    assert FakeChildBackend.search is FakeBackend.search
+    with Recorder() as recorder:
+        FakeChildBackend().search('hello')
+    assert len(recorder.calls) == 1
+
+
+def test_bind_carries_recorder_to_other_threads():
+    pool = ThreadPool(2)
+    threads = []
+    def search(query_string):
+        threads.append(threading.current_thread())
+        return FakeBackend().search(query_string)
+    try:
+        with Recorder() as recorder:
+            pool.map(bind(search), ['a', 'b', 'c'])
+    finally:
+        pool.close()
+    assert threading.current_thread() not in threads
+    assert sorted(call.query_string for call in recorder.calls) == ['a', 'b', 'c']
+
+
+def test_phases_accumulate():
+    recorder = Recorder()
+    with recorder.phase('wrap'):
+        pass
+    first = recorder.phases['wrap']
+    with recorder.phase('view'):
+        with recorder.phase('wrap'):
+            pass
+    assert list(recorder.phases) == ['wrap', 'view']
+    assert recorder.phases['wrap'] > first
+
+
+def test_load_hook():
+    assert load_hook(None) is None
+    assert load_hook(len) is len
+    assert load_hook('haystackbrowser.instrumentation.log_backend_calls') is log_backend_calls
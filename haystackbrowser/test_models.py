@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+try:
+    from django.core.urlresolvers import (NoReverseMatch, reverse,
+                                          get_script_prefix, set_script_prefix)
+except ImportError:  # >= Django 2.0
+    from django.urls import (NoReverseMatch, reverse, get_script_prefix,
+                             set_script_prefix)
+from haystackbrowser.models import SearchResultWrapper
+from haystackbrowser.utils import get_admin_urls
+try:
+    from unittest.mock import Mock, patch
+except ImportError:  # < python 3.3
+    from mock import Mock, patch
+
+
+def make_result(app_label='auth', model_name='user', pk='1'):
+    return Mock(app_label=app_label, model_name=model_name, pk=pk)
+
+
+def test_wrapper_urls_match_reverse():
+    wrapper = SearchResultWrapper(make_result(pk='a/b c'), 'admin')
+    assert wrapper.get_app_url() == reverse('admin:app_list',
+                                            kwargs={'app_label': 'auth'})
+    assert wrapper.get_model_url() == reverse('admin:auth_user_changelist')
+    assert wrapper.get_pk_url() == reverse('admin:auth_user_change',
+                                           args=('a/b c',))
+    assert wrapper.get_detail_url() == reverse(
+        'admin:haystackbrowser_haystackresults_change',
+        kwargs={'content_type': 'auth.user', 'pk': 'a/b c'})
+
+
+def test_wrapper_urls_missing_are_none():
+    wrapper = SearchResultWrapper(make_result(app_label='nope',
+                                              model_name='nope'), 'admin')
+    assert wrapper.get_model_url() is None
+    assert wrapper.get_pk_url() is None
+
+
+def test_admin_urls_resolved_once_per_model():
+    get_admin_urls('admin', 'auth', 'group')
+    with patch('haystackbrowser.utils.reverse') as reverser:
+        for pk in range(10):
+            wrapper = SearchResultWrapper(make_result(model_name='group',
+                                                      pk=pk), 'admin')
+            wrapper.get_model_url()
+            wrapper.get_pk_url()
+            wrapper.get_detail_url()
+        assert reverser.called is False
+
+
+def test_admin_urls_per_script_prefix():
+    get_admin_urls('admin', 'auth', 'group')
+    original = get_script_prefix()
+    set_script_prefix('/mounted/')
+    try:
+        wrapper = SearchResultWrapper(make_result(model_name='group'), 'admin')
+        assert wrapper.get_model_url() == '/mounted/admin/auth/group/'
+    finally:
+        set_script_prefix(original)
+    wrapper = SearchResultWrapper(make_result(model_name='group'), 'admin')
+    assert wrapper.get_model_url() == reverse('admin:auth_group_changelist')
+
+
+def test_admin_urls_restricted_pk_reversed_per_object():
+    real_reverse = reverse
+    def digits_only(viewname, args=None, kwargs=None):
+        if viewname == 'admin:auth_user_change' and not args[0].isdigit():
+            raise NoReverseMatch(viewname)
+        return real_reverse(viewname, args=args, kwargs=kwargs)
+    with patch.dict('haystackbrowser.utils._admin_urls', clear=True), \
+            patch('haystackbrowser.utils.reverse', side_effect=digits_only):
+        wrapper = SearchResultWrapper(make_result(pk='3'), 'admin')
+        assert wrapper.get_pk_url() == reverse('admin:auth_user_change',
+                                               args=('3',))
+        wrapper = SearchResultWrapper(make_result(pk='x'), 'admin')
+        assert wrapper.get_pk_url() is None
+        assert wrapper.get_detail_url() == reverse(
+            'admin:haystackbrowser_haystackresults_change',
+            kwargs={'content_type': 'auth.user', 'pk': 'x'})
+
+
+def test_wrapper_extracts_fields_once():
+    result = make_result()
+    result.get_stored_fields.return_value = {'text': '<b>hi</b>'}
+    result.get_additional_fields.return_value = {'text': '<b>hi</b>',
+                                                 'other': 'there'}
+    result.searchindex.fields = {}
+    wrapper = SearchResultWrapper(result, 'admin')
+    for x in range(3):
+        assert wrapper.get_stored_field_count() == 1
+        assert wrapper.get_additional_field_count() == 1
+        assert wrapper.get_stored_fields()['text']['safe'] == 'hi'
+        assert wrapper.get_additional_fields()['other']['raw'] == 'there'
+    assert result.get_stored_fields.call_count == 1
+    assert result.get_additional_fields.call_count == 1
+
+
+def test_model_attrs_shared_per_index_class():
+    class FakeIndex(object):
+        fields = {'text': Mock(model_attr='body'),
+                  'other': Mock(model_attr=None)}
+    wrappers = []
+    for pk in range(3):
+        result = make_result(pk=pk)
+        result.searchindex = FakeIndex()
+        wrappers.append(SearchResultWrapper(result, 'admin'))
+    first = wrappers[0].get_model_attrs()
+    assert first == {'text': 'body'}
+    assert all(x.get_model_attrs() is first for x in wrappers)
+
+
+def test_facet_wrapper_keeps_backend_order():
+    from django.http import QueryDict
+    from haystackbrowser.models import FacetWrapper
+    facets = FacetWrapper({
+        'fields': {'tag': [('b', 5), ('a', 3), ('empty', 0), (' ', 2)],
+                   'author': [('bob', 1)]},
+        'queries': {'tag:a': 3},
+    }, querydict=QueryDict('q=hi&p=2', mutable=True))
+    groups = facets.get_field_facets()
+    assert groups is facets.get_field_facets()
+    assert [x.grouper.fieldname for x in groups] == ['author', 'tag']
+    assert [(x.value, x.count) for x in groups[1].list] == [('b', 5), ('a', 3)]
+    assert groups[1].list[0].fieldvalue == 'tag%3Ab'
+    assert groups[1].grouper.link() == '?q=hi'
+    assert facets.get_date_facets() == ()
+    assert [x.count for x in facets.get_query_facets()[0].list] == [3]
+    assert len(facets) == 3
+    assert [(x['field'], x['value'], x['count'], x['fieldvalue'])
+            for x in facets.get_facets_from('fields')] == [
+        ('author', 'bob', 1, 'author%3Abob'),
+        ('tag', 'b', 5, 'tag%3Ab'),
+        ('tag', 'a', 3, 'tag%3Aa'),
+    ]
+    tag_facet = list(facets.get_facets_from('fields'))[1]['facet']
+    assert tag_facet is groups[1].grouper
+
+
+def test_facet_wrapper_limit_marks_truncated_groups():
+    from django.http import QueryDict
+    from haystackbrowser.models import FacetWrapper
+    facets = FacetWrapper({
+        'fields': {'tag': [('b', 5), ('a', 3), ('c', 1)],
+                   'author': [('bob', 1), ('alice', 1)]},
+    }, querydict=QueryDict('', mutable=True), limit=2)
+    author, tag = facets.get_field_facets()
+    assert [x.value for x in tag.list] == ['b', 'a']
+    assert tag.truncated is True
+    assert author.truncated is False
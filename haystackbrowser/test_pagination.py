@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import pytest
+from django.core.paginator import InvalidPage
+from haystackbrowser.pagination import (CursorPaginator, FanOutPaginator,
+                                        SearchPaginator, decode_cursor,
+                                        encode_cursor, iter_results,
+                                        merge_facet_counts, run_query)
+try:
+    from unittest.mock import Mock
+except ImportError:  # < python 3.3
+    from mock import Mock
+
+
+def make_result(pk, score=1.0):
+    return Mock(app_label='test', model_name='testing', pk=pk, score=score,
+                id=None)
+
+
+def make_sqs(results, hits):
+    query = Mock()
+    query.get_results.return_value = results
+    query.get_count.return_value = hits
+    query.get_facet_counts.return_value = {'fields': {}}
+    sqs = Mock()
+    sqs.query._clone.return_value = query
+    sqs.post_process_results.side_effect = lambda x: x
+    sqs.order_by.return_value = sqs
+    sqs.narrow.return_value = sqs
+    return sqs, query
+
+
+def test_cursor_roundtrip():
+    position = {'page': 3, 'after': 'test.testing.4'}
+    token = encode_cursor(position)
+    assert '=' not in token
+    assert decode_cursor(token) == position
+
+
+@pytest.mark.parametrize('token', ['!!!', 'WzFd', 'bm90IGpzb24'])
+def test_cursor_invalid(token):
+    with pytest.raises(InvalidPage):
+        decode_cursor(token)
+
+
+def test_run_query_is_one_request():
+    sqs, query = make_sqs(results=[make_result(1)], hits=10)
+    results, hits, facets = run_query(sqs, 5, 10)
+    query.set_limits.assert_called_once_with(5, 10)
+    assert len(results) == 1
+    assert hits == 10
+    assert facets == {'fields': {}}
+
+
+def test_cursor_paginator_offset_fallback():
+    sqs, query = make_sqs(results=[make_result(1), make_result(2)], hits=5)
+    paginator = CursorPaginator(sqs, per_page=2, keyset=False)
+    page = paginator.page()
+    assert page.number == 1
+    assert page.remaining == 3
+    assert page.count == 5
+    assert page.facet_counts == {'fields': {}}
+    assert decode_cursor(page.next_cursor) == {'page': 2, 'offset': 2}
+    next_page = paginator.page(page.next_cursor)
+    query.set_limits.assert_called_with(2, 4)
+    assert next_page.number == 2
+    assert sqs.narrow.called is False
+
+
+def test_cursor_paginator_keyset():
+    sqs, query = make_sqs(results=[make_result(1), make_result(2)], hits=4)
+    paginator = CursorPaginator(sqs, per_page=2, keyset=True)
+    sqs.order_by.assert_called_once_with('id')
+    page = paginator.page()
+    assert decode_cursor(page.next_cursor) == {'page': 2,
+                                               'after': 'test.testing.2',
+                                               'seen': 2}
+    next_page = paginator.page(page.next_cursor)
+    sqs.narrow.assert_called_once_with('id:{"test.testing.2" TO *}')
+    # deep pages never need an offset.
+    query.set_limits.assert_called_with(0, 2)
+    assert next_page.facet_counts is None
+
+
+def test_cursor_paginator_keyset_uses_stored_identifier():
+    first = make_result(1)
+    first.id = 'custom-1'
+    sqs, query = make_sqs(results=[first], hits=3)
+    page = CursorPaginator(sqs, per_page=1, keyset=True).page()
+    assert decode_cursor(page.next_cursor) == {'page': 2, 'after': 'custom-1',
+                                               'seen': 1}
+
+
+def test_cursor_paginator_keyset_counts_earlier_pages():
+    sqs, query = make_sqs(results=[make_result(3), make_result(4)], hits=3)
+    paginator = CursorPaginator(sqs, per_page=2, keyset=True)
+    # the narrowed query only counts what's after the cursor.
+    page = paginator.page(encode_cursor({'page': 2, 'after': 'test.testing.2',
+                                         'seen': 2}))
+    assert page.remaining == 1
+    assert page.count == 5
+
+
+def test_cursor_paginator_last_page():
+    sqs, query = make_sqs(results=[make_result(1)], hits=1)
+    page = CursorPaginator(sqs, per_page=2).page()
+    assert page.has_next() is False
+    assert page.has_other_pages() is False
+    assert page.remaining == 0
+
+
+def test_cursor_paginator_empty_later_page():
+    sqs, query = make_sqs(results=[], hits=0)
+    paginator = CursorPaginator(sqs, per_page=2)
+    cursor = encode_cursor({'page': 2, 'offset': 2})
+    with pytest.raises(InvalidPage):
+        paginator.page(cursor)
+    page = paginator.page(cursor, allow_empty=True)
+    assert list(page.object_list) == []
+    assert page.has_next() is False
+
+
+def test_cursor_paginator_max_offset():
+    sqs, query = make_sqs(results=[make_result(1), make_result(2)], hits=9)
+    paginator = CursorPaginator(sqs, per_page=2, max_offset=3)
+    page = paginator.page(encode_cursor({'page': 2, 'offset': 2}))
+    query.set_limits.assert_called_once_with(2, 3)
+    assert page.has_next() is False
+
+
+def test_iter_results_stops_when_documents_disappear():
+    first, query = make_sqs(results=[make_result(1), make_result(2)], hits=4)
+    # the other two were removed after the first batch.
+    query.get_results.side_effect = [[make_result(1), make_result(2)], []]
+    assert [x.pk for x in iter_results(first, 2)] == [1, 2]
+    assert query.get_results.call_count == 2
+
+
+def test_iter_results_stops_at_max_offset(caplog):
+    sqs, query = make_sqs(results=[make_result(1), make_result(2)], hits=9)
+    assert len(list(iter_results(sqs, 2, max_offset=4))) == 4
+    assert query.get_results.call_count == 2
+    assert 'leaving out 5' in caplog.text
+
+
+def test_search_paginator_takes_count_from_page():
+    sqs, query = make_sqs(results=[make_result(1), make_result(2)], hits=7)
+    paginator = SearchPaginator(sqs, per_page=2)
+    page = paginator.page(2)
+    query.set_limits.assert_called_once_with(2, 4)
+    assert query.get_results.call_count == 1
+    assert paginator.count == 7
+    assert paginator.num_pages == 4
+    assert paginator.display_count == 7
+    assert page.has_next() is True
+    assert paginator.facet_counts == {'fields': {}}
+    assert sqs.count.called is False
+
+
+def test_search_paginator_empty_page():
+    sqs, query = make_sqs(results=[], hits=2)
+    with pytest.raises(InvalidPage):
+        SearchPaginator(sqs, per_page=2).page(5)
+
+
+def test_search_paginator_approximate():
+    sqs, query = make_sqs(results=[make_result(1)], hits=123456)
+    paginator = SearchPaginator(sqs, per_page=10, approximate_after=10000)
+    paginator.page(1)
+    assert paginator.is_approximate is True
+    assert paginator.display_count == '10,000+'
+    assert paginator.num_pages == 1000
+    with pytest.raises(InvalidPage):
+        paginator.page(1001)
+
+
+class SerialPool(object):
+    def map(self, func, iterable):
+        return [func(x) for x in iterable]
+
+
+def test_fan_out_merges_by_score():
+    first, first_query = make_sqs(results=[make_result('a', 3.0),
+                                           make_result('b', 1.0)], hits=2)
+    second, second_query = make_sqs(results=[make_result('c', 2.0),
+                                             make_result('d', 0.5)], hits=5)
+    first_query.get_facet_counts.return_value = {
+        'fields': {'author': [('bob', 3)]}}
+    second_query.get_facet_counts.return_value = {
+        'fields': {'author': [('alice', 1), ('bob', 2)]}}
+    paginator = FanOutPaginator([('default', first), ('other', second)],
+                                per_page=2, pool=SerialPool())
+    page = paginator.page(2)
+    # both need everything up to the end of the page.
+    first_query.set_limits.assert_called_once_with(0, 4)
+    second_query.set_limits.assert_called_once_with(0, 4)
+    assert [x.pk for x in page.object_list] == ['b', 'd']
+    assert paginator.count == 7
+    assert [(x.alias, x.hits) for x in paginator.timings] == [('default', 2),
+                                                              ('other', 5)]
+    assert paginator.facet_counts == {
+        'fields': {'author': [('bob', 5), ('alice', 1)]},
+        'dates': {}, 'queries': {}}
+
+
+def test_fan_out_keeps_timings_when_cached():
+    class FakeResultCache(dict):
+        def get(self, start, end):
+            return dict.get(self, (start, end))
+
+        def set(self, start, end, response):
+            self[start, end] = response
+
+    result_cache = FakeResultCache()
+    first, first_query = make_sqs(results=[make_result('a')], hits=1)
+    paginator = FanOutPaginator([('default', first)], per_page=2,
+                                pool=SerialPool(), result_cache=result_cache)
+    paginator.page(1)
+    timings = paginator.timings
+    cached = FanOutPaginator([('default', first)], per_page=2,
+                             pool=SerialPool(), result_cache=result_cache)
+    assert [x.pk for x in cached.page(1).object_list] == ['a']
+    assert first_query.get_results.call_count == 1
+    assert cached.timings == timings
+    assert [x.alias for x in cached.timings] == ['default']
+
+
+def test_merge_facet_counts_ignores_missing():
+    assert merge_facet_counts([None, {}]) == {'fields': {}, 'dates': {},
+                                              'queries': {}}
+
+
+def test_merge_facet_counts_dates_and_queries():
+    merged = merge_facet_counts([
+        {'dates': {'created': [('2017-01-01', 2)]},
+         'queries': {'score:[1 TO *]': 3}},
+        {'dates': {'created': [('2017-01-01', 1), ('2016-01-01', 4)]},
+         'queries': {'score:[1 TO *]': 1, 'score:[* TO 1]': 2}},
+    ])
+    assert merged['dates'] == {'created': [('2016-01-01', 4),
+                                           ('2017-01-01', 3)]}
+    assert merged['queries'] == {'score:[1 TO *]': 4, 'score:[* TO 1]': 2}
+    # dates stay in order, however many each has.
+    merged = merge_facet_counts([
+        {'dates': {'created': [('2016-01-01', 1), ('2017-01-01', 9)]}},
+        {'dates': {'created': [('2018-01-01', 5)]}},
+    ])
+    assert merged['dates'] == {'created': [('2016-01-01', 1),
+                                           ('2017-01-01', 9),
+                                           ('2018-01-01', 5)]}
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+import pytest
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.template import Context
+from haystackbrowser.templatetags.haystackbrowser_data import (
+    HaystackBrowserForObject, get_prefetched, prefetch_results)
+
+skip_old_haystack = pytest.mark.skipif(settings.OLD_HAYSTACK is True,
+                                       reason="Doesn't apply to Haystack 1.2.x")
+
+
+@skip_old_haystack
+def test_for_object_uses_prefetched_results(mocker, rf):
+    def search(query_string, **kwargs):
+        if 'group' in query_string:
+            return {'results': [], 'hits': 0}
+        return {'results': [mocker.Mock(pk='1'), mocker.Mock(pk='2')],
+                'hits': 2}
+    backend = mocker.patch('haystack.backends.whoosh_backend.WhooshSearchBackend.search',
+                           side_effect=search)
+    context = Context({'request': rf.get('/')})
+    objs = [User(pk=1), Group(pk=3), User(pk=2), User(pk=1)]
+    prefetch_results(get_prefetched(context), objs)
+    assert backend.call_count == 2
+
+    tag = HaystackBrowserForObject.__new__(HaystackBrowserForObject)
+    for obj in objs:
+        output = tag.get_context(context, obj)
+        if isinstance(obj, User):
+            assert output['original'].object.pk == str(obj.pk)
+        else:
+            assert 'original' not in output
+    assert backend.call_count == 2
+
+    # already fetched, so nothing is asked for again.
+    prefetch_results(get_prefetched(context), objs)
+    assert backend.call_count == 2
+
+
+def test_prefetched_without_request_is_per_render():
+    context = Context({})
+    prefetched = get_prefetched(context)
+    assert get_prefetched(context) is prefetched
+    assert get_prefetched(Context({})) is not prefetched